@@ -44,6 +44,9 @@ _pre_locals = locals().copy()
 if True:
     from . import compat
     from . import common
+    from . import weightutil
+    from . import meshutil
+    from . import profiler
 
     from . import misc_DATA_PT_modifiers
     from . import misc_INFO_MT_curve_add
@@ -110,6 +113,25 @@ class AddonPreferences(bpy.types.AddonPreferences):
     is_apply_modifiers = bpy.props.BoolProperty(
         name="モディファイアを適用", default=False
     )
+    binding_cache_size = bpy.props.IntProperty(
+        name="Shape key transfer cache (MB)",
+        description="Memory kept for reusing shape key transfer bindings on redo, 0 to disable",
+        default=512,
+        min=0,
+        max=16384,
+        soft_min=0,
+        soft_max=4096,
+    )
+    is_profile_transfer = bpy.props.BoolProperty(
+        name="Log shape key transfer profile",
+        description="Time the phases of shape key transfers into a JSON-lines log in the config folder",
+        default=False,
+    )
+    is_report_profile = bpy.props.BoolProperty(
+        name="Report shape key transfer profile",
+        description="Show the slowest phases of a shape key transfer when it finishes",
+        default=False,
+    )
 
     custom_normal_blend = bpy.props.FloatProperty(
         name="CM3D2用法線のブレンド率",
@@ -220,6 +242,10 @@ class AddonPreferences(bpy.types.AddonPreferences):
         self.layout.label(text="Preferences:")
 
         self.layout.prop(self, "backup_ext", icon="FILE_BACKUP")
+        self.layout.prop(self, "binding_cache_size", icon="MEMORY")
+        row = self.layout.row()
+        row.prop(self, "is_profile_transfer", icon="TIME")
+        row.prop(self, "is_report_profile", icon="INFO")
 
         row = self.layout.row()
         row.operator("script.update_br_addon", icon="FILE_REFRESH")
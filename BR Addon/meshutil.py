@@ -0,0 +1,732 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from mathutils.bvhtree import BVHTree
+from mathutils.kdtree import KDTree
+from . import weightutil
+
+CO_DTYPE = np.float32
+
+
+def read_co(collection, dtype=CO_DTYPE) -> np.ndarray:
+    """Read the `co` of every item in a bpy collection into an (N, 3) array.
+
+    Works for `Mesh.vertices` as well as `ShapeKey.data`.
+    """
+    co = np.empty(len(collection) * 3, dtype=dtype)
+    collection.foreach_get("co", co)
+    return co.reshape(-1, 3)
+
+
+def write_co(collection, co: np.ndarray):
+    """Write an (N, 3) array back to the `co` of every item in a bpy collection."""
+    collection.foreach_set("co", np.ascontiguousarray(co, dtype=CO_DTYPE).ravel())
+
+
+def read_weights(vertices, group_indices) -> np.ndarray:
+    """Read the weights of the given vertex groups into an (N, G) array.
+
+    Vertices that are not assigned to a group get a weight of 0, as does
+    every vertex for a group index of -1.
+    """
+    return weightutil.VertexWeights.from_vertices(vertices).dense(group_indices)
+
+
+def can_read_mix_co(ob) -> bool:
+    """Whether read_mix_co() can reproduce the shape key mix of `ob`."""
+    shape_keys = ob.data.shape_keys
+    return bool(shape_keys and shape_keys.use_relative and not ob.show_only_shape_key)
+
+
+def read_mix_co(ob) -> np.ndarray:
+    """The current relative shape key mix of `ob`, like
+    `shape_key_add(from_mix=True)` but without adding a key.
+
+    Muted keys are skipped and each key is masked by its vertex group.
+    """
+    shape_keys = ob.data.shape_keys
+    reference_key = shape_keys.reference_key
+    mix = read_co(reference_key.data).astype(np.float64)
+    relative_cos = {reference_key.name: mix.copy()}
+    for key in shape_keys.key_blocks:
+        if key == reference_key or key.mute or key.value == 0.0:
+            continue
+        relative_co = relative_cos.get(key.relative_key.name)
+        if relative_co is None:
+            relative_co = relative_cos[key.relative_key.name] = read_co(
+                key.relative_key.data
+            )
+        influence = np.full(len(mix), key.value)
+        vertex_group = ob.vertex_groups.get(key.vertex_group)
+        if vertex_group is not None:
+            influence *= read_weights(ob.data.vertices, [vertex_group.index])[:, 0]
+        mix += (read_co(key.data) - relative_co) * influence[:, None]
+    return mix.astype(CO_DTYPE)
+
+
+def weight_match(
+    target_weights: np.ndarray,
+    source_weights: np.ndarray,
+    rows: np.ndarray,
+    indices: np.ndarray,
+    chunk_size: int = 65536,
+) -> np.ndarray:
+    """How well the weights of each (target row, source index) pair match.
+
+    Sums `target - |source - target|` over the groups and clamps it to
+    [0, 1], in chunks of pairs to bound the (pairs, G) temporaries.
+    """
+    matches = np.empty(len(rows), dtype=CO_DTYPE)
+    for start in range(0, len(rows), chunk_size):
+        stop = start + chunk_size
+        target = target_weights[rows[start:stop]]
+        source = source_weights[indices[start:stop]]
+        matches[start:stop] = (target - np.abs(source - target)).sum(axis=1)
+    return np.clip(matches, 0.0, 1.0, out=matches)
+
+
+def read_loop_triangles(me) -> np.ndarray:
+    """Vertex indices of every loop triangle of a mesh as a (T, 3) array."""
+    me.calc_loop_triangles()
+    tris = np.empty(len(me.loop_triangles) * 3, dtype=np.int32)
+    me.loop_triangles.foreach_get("vertices", tris)
+    return tris.reshape(-1, 3)
+
+
+def read_edges(me) -> np.ndarray:
+    """Vertex indices of every edge of a mesh as an (E, 2) array."""
+    edges = np.empty(len(me.edges) * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", edges)
+    return edges.reshape(-1, 2)
+
+
+def edge_neighborhood(edges: np.ndarray, vert_count: int) -> Correspondence:
+    """Uniform Laplacian smoothing of a mesh as a Correspondence: every vertex
+    averages itself and the vertices it shares an edge with.
+
+    Unlike a distance based neighborhood this never crosses between parts
+    that are close but not connected, and its size depends only on the edge
+    count.
+    """
+    verts = np.arange(vert_count, dtype=np.int32)
+    rows = np.concatenate((verts, edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((verts, edges[:, 1], edges[:, 0]))
+    order = np.argsort(rows, kind="stable")
+    indptr = np.concatenate(
+        ([0], np.cumsum(np.bincount(rows, minlength=vert_count), dtype=np.int64))
+    )
+    return Correspondence(indptr, cols[order], np.ones(len(cols)), vert_count)
+
+
+def transform_co(matrix, co: np.ndarray) -> np.ndarray:
+    """Apply a 4x4 `mathutils.Matrix` to an (N, 3) array of coordinates."""
+    m = np.array(matrix, dtype=co.dtype)
+    return co @ m[:3, :3].T + m[:3, 3]
+
+
+def moved_mask(deltas: np.ndarray) -> np.ndarray:
+    """Boolean mask of the rows of a (..., N, 3) delta array that are not zero.
+
+    Matches the old `length > 2e-126` test, 2e-126 being the smallest float != 0.
+    """
+    return np.any(deltas != 0.0, axis=-1)
+
+
+def stepped_mask(moved: np.ndarray, step_size: int) -> np.ndarray:
+    """Mask of the vertices a step-sized scan would write.
+
+    Every `step_size`-th vertex is sampled. When a sampled vertex moved, the
+    gaps on both sides of it are scanned too, and a moved vertex found in a
+    gap keeps the next sample active even if that sample itself did not move.
+    This reproduces the original per-vertex `step_size` loop exactly.
+    """
+    if step_size <= 1:
+        return moved.copy()
+
+    count = len(moved)
+    block_count = -(-count // step_size)
+    blocks = np.zeros(block_count * step_size, dtype=bool)
+    blocks[:count] = moved
+    blocks = blocks.reshape(block_count, step_size)
+
+    samples = blocks[:, 0].tolist()
+    gap_moved = blocks[:, 1:].any(axis=1).tolist()
+    gap_checked = [False] * block_count
+
+    just_changed = False
+    found_more = False
+    for block in range(block_count):
+        if samples[block] or found_more:
+            found_more = False
+            if not just_changed and 0 < block:
+                gap_checked[block - 1] = True
+                found_more = gap_moved[block - 1]
+            gap_checked[block] = True
+            found_more = gap_moved[block] or found_more
+            just_changed = True
+        else:
+            just_changed = False
+
+    checked = np.empty((block_count, step_size), dtype=bool)
+    checked[:, 0] = True
+    checked[:, 1:] = np.array(gap_checked, dtype=bool)[:, None]
+    return checked.ravel()[:count] & moved
+
+
+def voxel_sample(cos: np.ndarray, count: int) -> np.ndarray:
+    """Sorted indices of about `count` rows of (N, 3) coordinates, at most one
+    per cell of a uniform grid, so the sample spreads evenly over the mesh
+    regardless of its vertex density.
+    """
+    if len(cos) <= count:
+        return np.arange(len(cos))
+
+    lo = cos.min(axis=0)
+    extent = np.maximum(cos.max(axis=0) - lo, 1e-6)
+    # Start from a cell size that would give `count` cells over the bounding
+    # box, then resize it until about `count` of them are occupied
+    cell_size = float(np.cbrt(np.prod(extent) / count))
+    samples = np.arange(len(cos))
+    for _ in range(16):
+        cells = np.floor((cos - lo) / cell_size).astype(np.int64)
+        samples = np.unique(cells, axis=0, return_index=True)[1]
+        if count * 0.8 <= len(samples) <= count * 1.25:
+            break
+        cell_size *= float(np.sqrt(len(samples) / count))
+    return np.sort(samples)
+
+
+def falloff_weights(indptr, dists, mini_dists, extend_range: float) -> np.ndarray:
+    """Linear falloff of each neighbor in CSR rows, from 1 at the nearest
+    distance of its row down to 0 at `nearest distance * extend_range`.
+    """
+    mini_dists = np.repeat(
+        np.asarray(mini_dists, dtype=np.float64), np.diff(np.asarray(indptr))
+    )
+    dists = np.asarray(dists, dtype=np.float64)
+    diff_radius = mini_dists * (extend_range - 1.0)
+    multis = np.ones(len(dists))
+    is_falloff = 0.0 < diff_radius
+    multis[is_falloff] = (
+        diff_radius[is_falloff] - (dists[is_falloff] - mini_dists[is_falloff])
+    ) / diff_radius[is_falloff]
+    return multis
+
+
+def blend_curve(f: np.ndarray, blend: str) -> np.ndarray:
+    """Vectorized falloff curves, LINER as is, SMOOTH1 like
+    `common.in_out_quad_blend`, SMOOTH2 like `common.bezier_blend` and
+    TRIGONOMETRIC like `common.trigonometric_smooth`.
+    """
+    f = np.asarray(f, dtype=np.float64)
+    if blend == "TRIGONOMETRIC":
+        return np.sin((f - 0.5) * np.pi) * 0.5 + 0.5
+    elif blend == "SMOOTH1":
+        g = f - 0.5
+        return np.where(
+            f <= 0.5, 2.0 * np.sqrt(np.maximum(f, 0.0)), 2.0 * g * (1.0 - g) + 0.5
+        )
+    elif blend == "SMOOTH2":
+        return np.sqrt(np.maximum(f, 0.0)) * (3.0 - 2.0 * f)
+    return f
+
+
+def find_range_neighbors(
+    cos: np.ndarray, radius: float, progress_update=None, query_cos: np.ndarray = None
+):
+    """Every point of (N, 3) coordinates within `radius` of each of `query_cos`
+    (the points themselves by default, each including itself), with a KD tree.
+
+    Returns CSR rows (indptr, indices) and the distance of every entry.
+    """
+    kd = KDTree(len(cos))
+    for index, co in enumerate(cos.tolist()):
+        kd.insert(co, index)
+    kd.balance()
+    find_range = kd.find_range
+
+    if query_cos is None:
+        query_cos = cos
+    row_counts = []
+    indices = []
+    dists = []
+    for vert_index, co in enumerate(query_cos.tolist()):
+        hits = find_range(co, radius)
+        for near_co, near_index, dist in hits:
+            indices.append(near_index)
+            dists.append(dist)
+        row_counts.append(len(hits))
+        if progress_update:
+            progress_update(vert_index)
+
+    indptr = np.concatenate(([0], np.cumsum(row_counts, dtype=np.int64)))
+    return indptr, np.asarray(indices, dtype=np.int32), np.asarray(dists)
+
+
+def blur_deltas(deltas: np.ndarray, neighborhood: Correspondence, effect: str = "BOTH"):
+    """One smoothing step of (N, C) deltas (or weights), each replaced by the
+    weighted average of its neighborhood.
+
+    With ADD only the neighbors at least as long as the vertex's own delta
+    are averaged, with SUB only those at most as long, so a blur can only
+    grow or only shrink the deformation.
+    """
+    if effect == "BOTH":
+        return neighborhood.apply(deltas)
+
+    norms = np.sqrt(np.einsum("ij,ij->i", deltas, deltas))
+    rows = np.repeat(np.arange(neighborhood.target_count), np.diff(neighborhood.indptr))
+    near_norms = norms[neighborhood.indices]
+    if effect == "ADD":
+        keep = norms[rows] <= near_norms
+    else:
+        keep = near_norms <= norms[rows]
+    masked = Correspondence(
+        neighborhood.indptr,
+        neighborhood.indices,
+        neighborhood.weights * keep,
+        neighborhood.source_count,
+    )
+    return masked.apply(deltas)
+
+
+def barycentric_weights(points: np.ndarray, tri_cos: np.ndarray) -> np.ndarray:
+    """Barycentric weights of (M, 3) points on (M, 3, 3) triangles.
+
+    Points are expected to lie on their triangle (e.g. closest points), the
+    weights are clamped to the triangle anyway. Degenerate triangles weigh
+    their corners equally.
+    """
+    a, b, c = tri_cos[:, 0], tri_cos[:, 1], tri_cos[:, 2]
+    v0 = b - a
+    v1 = c - a
+    v2 = points - a
+    d00 = np.einsum("ij,ij->i", v0, v0)
+    d01 = np.einsum("ij,ij->i", v0, v1)
+    d11 = np.einsum("ij,ij->i", v1, v1)
+    d20 = np.einsum("ij,ij->i", v2, v0)
+    d21 = np.einsum("ij,ij->i", v2, v1)
+    denom = d00 * d11 - d01 * d01
+
+    weights = np.full((len(points), 3), 1.0 / 3.0)
+    is_valid = 1e-20 < np.abs(denom)
+    v = (d11 * d20 - d01 * d21)[is_valid] / denom[is_valid]
+    w = (d00 * d21 - d01 * d20)[is_valid] / denom[is_valid]
+    weights[is_valid] = np.stack((1.0 - v - w, v, w), axis=1)
+
+    np.clip(weights, 0.0, None, out=weights)
+    weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-20)
+    return weights
+
+
+def find_near_surface(
+    source_cos: np.ndarray,
+    tris: np.ndarray,
+    target_cos: np.ndarray,
+    extend_range: float = 1.0,
+    progress_update=None,
+    max_neighbors: int = 0,
+):
+    """Find the source triangles near each target point with a BVH tree.
+
+    The closest point on each triangle within `nearest distance * extend_range`
+    is spread over the triangle's corners with barycentric weights, so the
+    result samples the source surface like a finely subdivided source would.
+    With `max_neighbors` only that many nearest triangles are kept.
+
+    Returns CSR rows (indptr, indices) of source vertices, the distance of
+    every entry, the nearest distance of every row and the barycentric
+    weight of every entry.
+    """
+    tree = BVHTree.FromPolygons(source_cos.tolist(), tris.tolist(), all_triangles=True)
+    find_nearest = tree.find_nearest
+    find_nearest_range = tree.find_nearest_range
+
+    row_counts = []
+    locations = []
+    tri_indices = []
+    dists = []
+    mini_dists = []
+    for vert_index, target_co in enumerate(target_cos.tolist()):
+        location, normal, tri_index, mini_dist = find_nearest(target_co)
+        if tri_index is None:
+            row_counts.append(0)
+            mini_dists.append(0.0)
+            continue
+
+        hits = ()
+        if 1.0 < extend_range:
+            hits = find_nearest_range(target_co, mini_dist * extend_range)
+        if not hits:
+            hits = ((location, normal, tri_index, mini_dist),)
+        elif max_neighbors and max_neighbors < len(hits):
+            hits = sorted(hits, key=lambda hit: hit[3])[:max_neighbors]
+        for location, normal, tri_index, dist in hits:
+            locations.append(location)
+            tri_indices.append(tri_index)
+            dists.append(dist)
+        row_counts.append(len(hits))
+        mini_dists.append(mini_dist)
+
+        if progress_update:
+            progress_update(vert_index)
+
+    hit_tris = tris[np.asarray(tri_indices, dtype=np.int64)].reshape(-1, 3)
+    barys = barycentric_weights(
+        np.asarray(locations, dtype=np.float64).reshape(-1, 3),
+        source_cos[hit_tris].astype(np.float64),
+    )
+
+    indptr = np.concatenate(([0], np.cumsum(np.asarray(row_counts) * 3)))
+    return (
+        indptr,
+        hit_tris.ravel(),
+        np.repeat(np.asarray(dists, dtype=np.float64), 3),
+        mini_dists,
+        barys.ravel(),
+    )
+
+
+class Correspondence:
+    """Row-normalized sparse (CSR) map from source vertices to target vertices.
+
+    Row `i` lists the source vertices `indices[indptr[i]:indptr[i+1]]` that
+    contribute to target vertex `i` and their `weights`. Rows whose raw
+    weights sum to zero are left empty, so they map to a zero delta.
+    """
+
+    def __init__(self, indptr, indices, weights, source_count: int):
+        indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int32)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        row_counts = np.diff(indptr)
+        rows = np.repeat(np.arange(len(row_counts)), row_counts)
+        totals = np.bincount(rows, weights=weights, minlength=len(row_counts))
+        keep = 0.0 < totals[rows]
+        weights = weights[keep] / totals[rows[keep]]
+        indices = indices[keep]
+        row_counts = np.bincount(rows[keep], minlength=len(row_counts))
+
+        self.indptr = np.concatenate(([0], np.cumsum(row_counts)))
+        self.indices = indices
+        self.weights = weights.astype(CO_DTYPE)
+        self.source_count = source_count
+        self.is_nearest = bool(np.all(row_counts == 1))
+
+        self._rows = np.flatnonzero(row_counts)
+        self._starts = self.indptr[:-1][self._rows]
+
+    @classmethod
+    def from_nearest(cls, nearest_indices, source_count: int) -> Correspondence:
+        """Build a correspondence where each target copies one source vertex."""
+        nearest_indices = np.asarray(nearest_indices, dtype=np.int32)
+        return cls(
+            np.arange(len(nearest_indices) + 1),
+            nearest_indices,
+            np.ones(len(nearest_indices)),
+            source_count,
+        )
+
+    @property
+    def target_count(self) -> int:
+        return len(self.indptr) - 1
+
+    def fan_in(self) -> tuple[float, int]:
+        """Average and largest number of source vertices per target vertex."""
+        row_counts = np.diff(self.indptr)
+        if not len(row_counts):
+            return 0.0, 0
+        return float(row_counts.mean()), int(row_counts.max())
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    def batch_size(self, memory_budget: int) -> int:
+        """How many shape keys can be applied at once within `memory_budget` bytes."""
+        itemsize = np.dtype(CO_DTYPE).itemsize * 3
+        key_bytes = itemsize * (
+            2 * self.source_count + len(self.indices) + 2 * self.target_count
+        )
+        return max(1, memory_budget // max(1, key_bytes))
+
+    def apply(self, deltas: np.ndarray, start: int = 0, stop: int = None) -> np.ndarray:
+        """Map an (..., source_count, C) array, e.g. deltas, to (..., target_count, C).
+
+        `start` and `stop` limit the result to that range of target vertices,
+        so a long transfer can be split into chunks.
+        """
+        if stop is None:
+            stop = self.target_count
+        if self.is_nearest:
+            return deltas[..., self.indices[start:stop], :]
+
+        result = np.zeros(
+            deltas.shape[:-2] + (stop - start, deltas.shape[-1]), dtype=deltas.dtype
+        )
+        lo, hi = np.searchsorted(self._rows, (start, stop))
+        if lo < hi:
+            begin, end = self.indptr[start], self.indptr[stop]
+            weighted = (
+                deltas[..., self.indices[begin:end], :] * self.weights[begin:end, None]
+            )
+            result[..., self._rows[lo:hi] - start, :] = np.add.reduceat(
+                weighted, self._starts[lo:hi] - begin, axis=-2
+            )
+        return result
+
+
+class TransferBinding:
+    """Everything a shape key transfer needs from its source, prepared once.
+
+    Holds the correspondence to the target and, for every source shape key,
+    the sparse delta against the bind shape as (moved vertex indices, deltas).
+    """
+
+    def __init__(
+        self, correspondence: Correspondence, key_names, relative_key_names, key_diffs
+    ):
+        self.correspondence = correspondence
+        self.key_names = list(key_names)
+        self.relative_key_names = list(relative_key_names)
+        self.key_diffs = list(key_diffs)
+
+    @classmethod
+    def from_shape_keys(
+        cls, correspondence: Correspondence, binded_co: np.ndarray, key_blocks
+    ) -> TransferBinding:
+        """Read the delta of every key in `key_blocks` against `binded_co`."""
+        key_names = []
+        relative_key_names = []
+        key_diffs = []
+        for key in key_blocks:
+            diffs = read_co(key.data) - binded_co
+            indices = np.flatnonzero(moved_mask(diffs)).astype(np.int32)
+            key_names.append(key.name)
+            relative_key_names.append(key.relative_key.name)
+            key_diffs.append((indices, diffs[indices]))
+        return cls(correspondence, key_names, relative_key_names, key_diffs)
+
+    def rebind(self, correspondence: Correspondence, matrix=None) -> TransferBinding:
+        """The same source keys through another correspondence, with the deltas
+        mapped by the linear part of `matrix` (e.g. into another object's space).
+        """
+        key_diffs = self.key_diffs
+        if matrix is not None:
+            m = np.array(matrix, dtype=CO_DTYPE)[:3, :3]
+            if not np.array_equal(m, np.identity(3, dtype=CO_DTYPE)):
+                key_diffs = [(indices, diffs @ m.T) for indices, diffs in key_diffs]
+        return TransferBinding(
+            correspondence, self.key_names, self.relative_key_names, key_diffs
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.correspondence.nbytes + sum(
+            indices.nbytes + diffs.nbytes for indices, diffs in self.key_diffs
+        )
+
+    def is_moved(self, key_index: int) -> bool:
+        return 0 < len(self.key_diffs[key_index][0])
+
+    def max_delta_norms(self) -> np.ndarray:
+        """Largest delta length of every source key against the bind shape."""
+        return np.array(
+            [
+                (
+                    np.sqrt(np.einsum("ij,ij->i", diffs, diffs).max())
+                    if len(diffs)
+                    else 0.0
+                )
+                for indices, diffs in self.key_diffs
+            ]
+        )
+
+    def diffs(self, key_indices) -> np.ndarray:
+        """Dense (K, N_src, 3) deltas of the given source keys."""
+        result = np.zeros(
+            (len(key_indices), self.correspondence.source_count, 3), dtype=CO_DTYPE
+        )
+        for row, key_index in enumerate(key_indices):
+            indices, diffs = self.key_diffs[key_index]
+            result[row, indices] = diffs
+        return result
+
+
+def fingerprint(*parts) -> str:
+    """Hash arrays, strings, numbers and (nested) tuples of them into a key."""
+    digest = hashlib.blake2b(digest_size=16)
+
+    def _update(part):
+        if isinstance(part, np.ndarray):
+            digest.update(repr((part.dtype.str, part.shape)).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, (tuple, list)):
+            digest.update(b"(")
+            for item in part:
+                _update(item)
+            digest.update(b")")
+        else:
+            digest.update(repr(part).encode())
+            digest.update(b",")
+
+    for part in parts:
+        _update(part)
+    return digest.hexdigest()
+
+
+def object_fingerprint(ob, use_shape_keys=True, use_key_values=False) -> str:
+    """Fingerprint the transform, vertices and optionally shape keys of a mesh object.
+
+    `use_key_values` also covers everything the current shape key mix
+    depends on: values, slider ranges, muting and vertex group masks with
+    their weights.
+    """
+    me = ob.data
+    parts = [np.array(ob.matrix_world), read_co(me.vertices)]
+    if use_shape_keys and me.shape_keys:
+        shape_keys = me.shape_keys
+        if use_key_values:
+            parts.append(
+                (
+                    shape_keys.use_relative,
+                    shape_keys.eval_time,
+                    ob.show_only_shape_key,
+                    ob.active_shape_key_index,
+                )
+            )
+        mask_weights = None
+        for key in shape_keys.key_blocks:
+            parts.append((key.name, key.relative_key.name, read_co(key.data)))
+            if use_key_values:
+                parts.append(
+                    (
+                        key.value,
+                        key.slider_min,
+                        key.slider_max,
+                        key.mute,
+                        key.vertex_group,
+                    )
+                )
+                vertex_group = ob.vertex_groups.get(key.vertex_group)
+                if vertex_group is not None:
+                    if mask_weights is None:
+                        mask_weights = weightutil.VertexWeights.from_object(ob)
+                    parts.append(mask_weights.column(vertex_group.index))
+    return fingerprint(*parts)
+
+
+BINDING_FILE_VERSION = 1
+
+
+class BindingFileError(ValueError):
+    """A binding file that can't be used for the transfer at hand."""
+
+
+def save_binding(file, binding: TransferBinding, fingerprints: dict):
+    """Write a binding and the fingerprints it was made for as a compressed .npz.
+
+    `file` is a path or a binary file object, e.g. a `TemporaryFileWriter`.
+    """
+    correspondence = binding.correspondence
+    key_counts = [len(indices) for indices, diffs in binding.key_diffs]
+    if binding.key_diffs:
+        key_indices = np.concatenate([indices for indices, diffs in binding.key_diffs])
+        key_deltas = np.concatenate([diffs for indices, diffs in binding.key_diffs])
+    else:
+        key_indices = np.zeros(0, dtype=np.int32)
+        key_deltas = np.zeros((0, 3), dtype=CO_DTYPE)
+    np.savez_compressed(
+        file,
+        version=BINDING_FILE_VERSION,
+        indptr=correspondence.indptr,
+        indices=correspondence.indices,
+        weights=correspondence.weights,
+        source_count=correspondence.source_count,
+        key_names=np.array(binding.key_names, dtype=str),
+        relative_key_names=np.array(binding.relative_key_names, dtype=str),
+        key_indptr=np.concatenate(([0], np.cumsum(key_counts, dtype=np.int64))),
+        key_indices=key_indices,
+        key_deltas=key_deltas,
+        **{
+            f"fingerprint_{name}": np.array(value)
+            for name, value in fingerprints.items()
+        },
+    )
+
+
+def load_binding(file, fingerprints: dict) -> TransferBinding:
+    """Read a binding written by save_binding().
+
+    Raises BindingFileError unless the file holds every fingerprint of
+    `fingerprints` with the same value, i.e. it was made from the same meshes
+    with the same settings.
+    """
+    with np.load(file, allow_pickle=False) as data:
+        if int(data.get("version", -1)) != BINDING_FILE_VERSION:
+            raise BindingFileError("Unsupported binding file version")
+        for name, value in fingerprints.items():
+            stored = data.get(f"fingerprint_{name}")
+            if stored is None or str(stored) != value:
+                raise BindingFileError(f"The binding file doesn't match the {name}")
+
+        correspondence = Correspondence(
+            data["indptr"], data["indices"], data["weights"], int(data["source_count"])
+        )
+        key_indptr = data["key_indptr"]
+        key_indices = data["key_indices"]
+        key_deltas = data["key_deltas"].astype(CO_DTYPE, copy=False)
+        key_diffs = [
+            (key_indices[start:stop], key_deltas[start:stop])
+            for start, stop in zip(key_indptr[:-1], key_indptr[1:])
+        ]
+        return TransferBinding(
+            correspondence,
+            data["key_names"].tolist(),
+            data["relative_key_names"].tolist(),
+            key_diffs,
+        )
+
+
+class BindingCache:
+    """Least recently used cache of `TransferBinding`s, bounded in bytes."""
+
+    def __init__(self):
+        self._bindings: OrderedDict[str, TransferBinding] = OrderedDict()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._bindings)
+
+    def get(self, key: str) -> TransferBinding | None:
+        binding = self._bindings.get(key)
+        if binding is not None:
+            self._bindings.move_to_end(key)
+        return binding
+
+    def put(self, key: str, binding: TransferBinding, max_bytes: int):
+        """Store a binding, evicting the least recently used ones beyond `max_bytes`."""
+        self.remove(key)
+        if binding.nbytes > max_bytes:
+            return
+        self._bindings[key] = binding
+        self.nbytes += binding.nbytes
+        while self.nbytes > max_bytes:
+            _, evicted = self._bindings.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def remove(self, key: str):
+        binding = self._bindings.pop(key, None)
+        if binding is not None:
+            self.nbytes -= binding.nbytes
+
+    def clear(self):
+        self._bindings.clear()
+        self.nbytes = 0
+
+
+# Bindings of recent transfers, so redoing one only re-applies the shape keys
+binding_cache = BindingCache()
@@ -1,13 +1,19 @@
 # 「プロパティ」エリア → 「メッシュデータ」タブ → 「シェイプキー」パネル → ▼ボタン
+import os
 import time
+import itertools
+import collections
 import bpy
 import bmesh
 import mathutils
 import traceback
 from typing import TYPE_CHECKING
 import abc
+import numpy as np
 from . import common
 from . import compat
+from . import meshutil
+from . import profiler
 from .translations.pgettext_functions import *
 
 
@@ -30,6 +36,7 @@ def menu_func(self, context):
         )
         sub.operator("object.precision_shape_key_transfer", icon="MOD_MESHDEFORM")
         sub.operator("object.weighted_shape_key_transfer", icon="MOD_VERTEX_WEIGHT")
+        sub.operator("object.batch_shape_key_transfer", icon="MOD_DATA_TRANSFER")
         sub.separator()
     else:
         sub.separator()
@@ -42,6 +49,7 @@ def menu_func(self, context):
         sub.operator("object.quick_shape_key_transfer", icon_value=icon_id)
         sub.operator("object.precision_shape_key_transfer", icon_value=icon_id)
         sub.operator("object.weighted_shape_key_transfer", icon_value=icon_id)
+        sub.operator("object.batch_shape_key_transfer", icon_value=icon_id)
         sub.separator()
 
 
@@ -49,139 +57,90 @@ class transfer_shape_key_iter:
     index = -1
 
     target_ob = None
-    source_ob = None
+    binding = None
+    key_indices = None
+    is_quiet = False
 
-    binded_shape_key = None
-    binded_shape_key_data = None
-
-    # target_mat = None
-    # source_mat = None
-
-    source_iter = None
-
-    source_shape_key_data = None
+    target_indices = None
     target_shape_key_data = None
 
-    def __init__(self, target_ob, source_ob, binded_shape_key=None):
+    def __init__(self, target_ob, binding, key_indices, is_quiet=False):
         self.target_ob = target_ob
-        self.source_ob = source_ob
-        self.binded_shape_key = (
-            binded_shape_key or self.source_ob.data.shape_keys.key_blocks[0]
-        )
+        self.binding = binding
+        self.key_indices = key_indices
+        # Only touch key data and relative keys, no values or active index,
+        # so the depsgraph isn't tagged for every key
+        self.is_quiet = is_quiet
 
     def __iter__(self):
         self.index = -1
-        if self.source_iter:
-            self.source_iter = iter(self.source_iter)
 
-        # self.target_mat = self.target_ob.matrix_world
-        # self.source_mat = self.source_ob.matrix_world
-
-        if self.source_ob and self.source_ob.data.shape_keys:
-            binded_index = self.source_ob.data.shape_keys.key_blocks.find(
-                self.binded_shape_key.name
-            )
-            # self.binded_shape_key_data = bmesh.new(use_operators=False)
-            # self.binded_shape_key_data.from_mesh(self.source_ob.data, use_shape_key=True, shape_key_index=binded_index)
-            # self.binded_shape_key_data.verts.ensure_lookup_table()
-            self.binded_shape_key_data = self.binded_shape_key.data
-            self.source_iter = iter(self.source_ob.data.shape_keys.key_blocks)
+        # Resolve target keys by name once, instead of key_blocks.find() per key
+        target_shape_keys = self.target_ob.data.shape_keys
+        self.target_indices = (
+            {key.name: i for i, key in enumerate(target_shape_keys.key_blocks)}
+            if target_shape_keys
+            else {}
+        )
         return self
 
     def __next__(self):
         target_me = self.target_ob.data
-        source_me = self.source_ob.data
 
-        target_shape_key = None
-        source_shape_key = next(self.source_iter, None)
-        if not source_shape_key:
+        if len(self.key_indices) <= self.index + 1:
             raise StopIteration
-
         self.index += 1
+        source_index = self.key_indices[self.index]
+        source_shape_key_name = self.binding.key_names[source_index]
+        relative_key_name = self.binding.relative_key_names[source_index]
 
-        if target_me.shape_keys:
-            if source_shape_key.name in target_me.shape_keys.key_blocks:
-                target_shape_key = target_me.shape_keys.key_blocks[
-                    source_shape_key.name
-                ]
-            else:
-                target_shape_key = self.target_ob.shape_key_add(
-                    name=source_shape_key.name, from_mix=False
-                )
+        target_index = self.target_indices.get(source_shape_key_name)
+        if target_index is not None:
+            target_shape_key = target_me.shape_keys.key_blocks[target_index]
         else:
             target_shape_key = self.target_ob.shape_key_add(
-                name=source_shape_key.name, from_mix=False
+                name=source_shape_key_name, from_mix=False
             )
+            target_index = len(self.target_indices)
+            self.target_indices[target_shape_key.name] = target_index
 
-        relative_key_name = source_shape_key.relative_key.name
-
-        rel_key = target_me.shape_keys.key_blocks.get(relative_key_name)
-        if rel_key:
-            target_shape_key.relative_key = rel_key
-
-        if not self.target_ob.active_shape_key_index == 0:
-            target_me.shape_keys.key_blocks[
-                self.target_ob.active_shape_key_index
-            ].value = 0.0
-        if not self.source_ob.active_shape_key_index == 0:
-            source_me.shape_keys.key_blocks[
-                self.source_ob.active_shape_key_index
-            ].value = 0.0
-
-        target_index = target_me.shape_keys.key_blocks.find(target_shape_key.name)
-        source_index = source_me.shape_keys.key_blocks.find(source_shape_key.name)
+        rel_index = self.target_indices.get(relative_key_name)
+        if rel_index is not None:
+            target_shape_key.relative_key = target_me.shape_keys.key_blocks[rel_index]
 
-        self.target_ob.active_shape_key_index = target_index
-        self.source_ob.active_shape_key_index = source_index
+        if not self.is_quiet:
+            if not self.target_ob.active_shape_key_index == 0:
+                target_me.shape_keys.key_blocks[
+                    self.target_ob.active_shape_key_index
+                ].value = 0.0
 
-        target_shape_key.value = 1.0
-        source_shape_key.value = 1.0
+            self.target_ob.active_shape_key_index = target_index
+            target_shape_key.value = 1.0
 
-        # source_shape_key_data = [compat.mul3(self.source_mat, source_shape_key.data[v.index].co, self.target_mat) - compat.mul3(self.source_mat, source_me.vertices[v.index].co, self.target_mat) for v in source_me.vertices]
-        # for i, v in enumerate(self.source_bind_data):
-        #    shape_co = compat.mul3(self.source_mat, source_shape_key.data[i].co, self.target_mat)
-        #    mesh_co  = compat.mul3(self.source_mat, self.source_bind_data[i].co, self.target_mat)
-        #    self.source_shape_key_data[i] = shape_co - mesh_co
-
-        # self.target_shape_key_data = bmesh.from_edit_mesh(self.target_ob.data)
-        # self.source_shape_key_data = bmesh.from_edit_mesh(self.source_ob.data)
-        # self.source_shape_key_data = bmesh.new(use_operators=False)
-        # self.source_shape_key_data.from_mesh(self.source_ob.data, use_shape_key=True, shape_key_index=source_index)
-
-        # self.target_shape_key_data.verts.ensure_lookup_table()
-        # self.source_shape_key_data.verts.ensure_lookup_table()
-
-        self.source_shape_key_data = source_shape_key.data
         self.target_shape_key_data = target_shape_key.data
 
         return (
-            self.index,
+            source_index,
             target_shape_key,
-            self.binded_shape_key_data,
-            self.source_shape_key_data,
             self.target_shape_key_data,
         )
 
     # update() will free resources for the current iteration of a loop, but not the loop itself.
     def update(self, destructive=False):
-        pass
-        # if self.target_shape_key_data and self.target_shape_key_data.is_valid:
-        # bmesh.update_edit_mesh(self.target_ob.data, loop_triangles=True, destructive=destructive)
-        # self.target_shape_key_data.free()
-        # pass
-
-        # if self.source_shape_key_data and self.source_shape_key_data.is_valid:
-        # bmesh.update_edit_mesh(self.source_ob.data, loop_triangles=True, destructive=destructive)
-        # self.source_shape_key_data.free()
-        # pass
+        self.target_shape_key_data = None
 
     # free() will release all resources for the loop, leaving it unable to run unless iter() is used again.
     def free(self, destructive=False):
-        pass
-        # self.update()
-        # if self.binded_shape_key_data and self.binded_shape_key_data.is_valid:
-        # bmesh.update_edit_mesh(self.source_ob.data, loop_triangles=True, destructive=destructive)
-        # self.binded_shape_key_data.free()
+        self.update()
+        self.target_indices = None
+
+
+def profile_log_path() -> str:
+    """Rotating JSON-lines log of shape key transfer profiles."""
+    return os.path.join(
+        bpy.utils.user_resource("CONFIG", path="br_addon", create=True),
+        "shape_key_transfer_profile.jsonl",
+    )
 
 
 if TYPE_CHECKING:
@@ -203,11 +162,117 @@ class shape_key_transfer_op(_op_base):
     subdivide_number = bpy.props.IntProperty(
         name="参照元の分割", default=1, min=0, max=10, soft_min=0, soft_max=10
     )
+    items = [
+        ("SUBDIVIDE", "Subdivide source", "", "LATTICE_DATA", 1),
+        ("SURFACE", "Closest surface point", "", "SNAP_FACE", 2),
+    ]
+    bind_method = bpy.props.EnumProperty(
+        items=items,
+        name="Bind method",
+        default="SUBDIVIDE",
+        description="Subdivide a copy of the source, or interpolate the source faces at the closest point",
+    )
+    is_batch = bpy.props.BoolProperty(
+        name="Batch shape keys",
+        default=False,
+        description="Transfer several shape keys at once, as many as fit in the memory budget",
+    )
+    batch_memory_budget = bpy.props.IntProperty(
+        name="Memory budget (MB)",
+        default=256,
+        min=16,
+        max=16384,
+        soft_min=16,
+        soft_max=4096,
+    )
+    tick_budget = bpy.props.IntProperty(
+        name="Time budget per tick (ms)",
+        default=12,
+        min=1,
+        max=1000,
+        soft_min=1,
+        soft_max=100,
+        description="How long the transfer may run between redraws when run interactively",
+    )
+    items = [
+        ("ALL", "All vertices", "", "MESH_DATA", 1),
+        ("SELECTED", "Selected vertices", "", "RESTRICT_SELECT_OFF", 2),
+        ("VERTEX_GROUP", "Vertex group", "", "GROUP_VERTEX", 3),
+    ]
+    target_restrict = bpy.props.EnumProperty(
+        items=items,
+        name="Target vertices",
+        default="ALL",
+        description="Only transfer to these target vertices, the others are left as they are",
+    )
+    target_vertex_group = bpy.props.StringProperty(
+        name="Target vertex group",
+        default="",
+        description="Transfer only to the vertices assigned to this group of the target",
+    )
+    is_preview = bpy.props.BoolProperty(
+        name="Preview active shape key",
+        default=False,
+        description="Transfer only the active source shape key to a sample of the target vertices and interpolate the rest, for tuning the settings. Turn it off to transfer everything",
+    )
+    preview_vertex_count = bpy.props.IntProperty(
+        name="Preview vertices",
+        default=2000,
+        min=100,
+        max=100000,
+        soft_min=100,
+        soft_max=20000,
+    )
+    items = [
+        (
+            "NONE",
+            "None",
+            "Bind the meshes, or reuse the binding of a recent transfer",
+            "BLANK1",
+            1,
+        ),
+        (
+            "SAVE",
+            "Save",
+            "Bind the meshes and save the binding to the file",
+            "EXPORT",
+            2,
+        ),
+        (
+            "LOAD",
+            "Load",
+            "Load the binding from the file instead of binding the meshes",
+            "IMPORT",
+            3,
+        ),
+    ]
+    binding_file_mode = bpy.props.EnumProperty(
+        items=items,
+        name="Binding file",
+        default="NONE",
+        description="Save or load the binding, to reuse it in another session. A loaded binding is refused unless it was made from the same meshes with the same settings",
+    )
+    binding_filepath = bpy.props.StringProperty(
+        name="Binding file path",
+        default="//shape_key_binding.npz",
+        subtype="FILE_PATH",
+    )
+    is_quiet = bpy.props.BoolProperty(
+        name="Update viewport only at the end",
+        default=True,
+        description="Don't show each shape key while it is transferred, which re-evaluates the mesh for every key",
+    )
+
+    # Target vertices * shape keys transferred per loop() call
+    chunk_size = 65536
+    # Whether the active object is the source instead of the target
+    is_multi_target = False
 
     def __init__(self):
         self.target_ob = None
         self.source_ob = None
         self.og_source_ob = None
+        self.binding = None
 
         self._start_time = 0
         self._timer = None
@@ -221,48 +286,107 @@ class shape_key_transfer_op(_op_base):
 
         self.binded_shape_key = None
         self.kd = None
+        self.source_cos = None
+        self.source_tris = None
+        self.target_subset = None
+        self.write_subset = None
+        self.preview_map = None
         self.is_shapeds = {}
 
+        self.my_iter = None
+        self.key_indices = None
+        self.batch_size = 1
+        self.batch = None
+        self.is_moveds = None
+        self.source_diffs = None
+        self.near_diffs = None
+        self.row_index = 0
+
+        self._loop_start_time = 0
+        self.done_verts = 0
+        self.done_keys = 0
+
+        self.profiler = None
+
     def draw(self, context):
+        row = self.layout.row(align=True)
+        row.prop(self, "is_preview", icon="HIDE_OFF")
+        sub = row.row(align=True)
+        sub.active = self.is_preview
+        sub.prop(self, "preview_vertex_count")
         self.layout.prop(self, "is_first_remove_all", icon="ERROR")
-        self.layout.prop(self, "subdivide_number", icon="LATTICE_DATA")
+        self.layout.prop(self, "bind_method", icon="SNAP_ON")
+        sub = self.layout.row()
+        sub.active = self.bind_method == "SUBDIVIDE"
+        sub.prop(self, "subdivide_number", icon="LATTICE_DATA")
         self.layout.prop(self, "is_remove_empty", icon="X")
         self.layout.prop(self, "is_bind_current_mix", icon="AUTOMERGE_OFF")
+        row = self.layout.row(align=True)
+        row.prop(self, "is_batch", icon="SHAPEKEY_DATA")
+        sub = row.row(align=True)
+        sub.active = self.is_batch
+        sub.prop(self, "batch_memory_budget", icon="MEMORY")
+        self.layout.prop(self, "tick_budget", icon="TIME")
+        self.layout.prop(self, "is_quiet", icon="RESTRICT_VIEW_ON")
+        row = self.layout.row(align=True)
+        row.prop(self, "target_restrict", icon="RESTRICT_SELECT_OFF")
+        if self.target_restrict == "VERTEX_GROUP":
+            target_ob = context.active_object
+            if target_ob and not self.is_multi_target:
+                row.prop_search(
+                    self, "target_vertex_group", target_ob, "vertex_groups", text=""
+                )
+            else:
+                row.prop(self, "target_vertex_group", text="")
+        if not self.is_multi_target:
+            row = self.layout.row(align=True)
+            row.prop(self, "binding_file_mode", icon="FILE")
+            sub = row.row(align=True)
+            sub.active = self.binding_file_mode != "NONE"
+            sub.prop(self, "binding_filepath", text="")
 
     def execute(self, context):
         self.pre_selected = list(context.selected_objects)
         self.pre_mode = context.mode
 
-        self.target_ob, self.source_ob, self.og_source_ob = (
-            common.get_target_and_source_ob(context, copySource=True)
-        )
-        print(f"returned {self.source_ob.data.shape_keys}")
+        self.target_ob, self.og_source_ob = common.get_target_and_source_ob(context)
+        self.source_ob = None
+        self.start_profile([self.target_ob])
 
         bpy.ops.object.mode_set(mode="OBJECT")
-        compat.set_hide(self.og_source_ob, True)
 
         self._start_time = time.time()
         self._timer = None
         self.is_finished = False
         self.is_canceled = False
 
+        self.binding = None
         self.binded_shape_key = None
-        self.source_bind_data = None
         self.kd = None
+        self.source_cos = None
+        self.source_tris = None
+        self.target_subset = None
+        self.write_subset = None
+        self.preview_map = None
         self.is_shapeds = {}
 
         try:
             self.prepare(context)
 
         except Exception as ex:
+            if isinstance(ex, meshutil.BindingFileError):
+                message = str(ex)
+            else:
+                message = "Error while preparing shapekey transfer."
             if not self.options.is_invoke:
                 # self.cleanup(context)
-                raise RuntimeError("Error while preparing shapekey transfer.")
+                # Still stop the profiler, it may be tracing memory
+                self.is_canceled = True
+                self.end_profile()
+                raise RuntimeError(message)
             self.is_canceled = True
             traceback.print_exc()
-            self.report(
-                type={"ERROR"}, message="Error while preparing shapekey transfer."
-            )
+            self.report(type={"ERROR"}, message=message)
             self.cancel(context)
             return {"FINISHED"}
 
@@ -279,7 +403,8 @@ class shape_key_transfer_op(_op_base):
             # run synchronously
             try:
                 while not self.is_finished:
-                    self.is_finished = self.loop(context)
+                    with self.profiler.phase("apply"):
+                        self.is_finished = self.loop(context)
                 self.finish(context)
                 return {"FINISHED"}
             finally:
@@ -308,7 +433,14 @@ class shape_key_transfer_op(_op_base):
         if not self.is_canceled and not self.is_finished:
             # print("Loop")
             try:
-                self.is_finished = self.loop(context)
+                # Run as many chunks as fit in the budget, at least one per tick
+                deadline = time.perf_counter() + self.tick_budget / 1000.0
+                while True:
+                    with self.profiler.phase("apply"):
+                        self.is_finished = self.loop(context)
+                    if self.is_finished or deadline <= time.perf_counter():
+                        break
+                self.update_status(context)
             except:
                 self.is_canceled = True
                 traceback.print_exc()
@@ -336,41 +468,321 @@ class shape_key_transfer_op(_op_base):
                 return {"FINISHED"}
 
     def prepare(self, context):
+        self.prepare_subsets()
+        cache_bytes = common.preferences().binding_cache_size * 1024 * 1024
+        # Fingerprints hash the meshes, only worth it when something uses them
+        if 0 < cache_bytes or self.binding_file_mode != "NONE":
+            with self.profiler.phase("fingerprint"):
+                fingerprints = self.binding_fingerprints()
+                binding_key = meshutil.fingerprint(*fingerprints.values())
+        if self.binding_file_mode == "LOAD":
+            with self.profiler.phase("binding_load"):
+                self.binding = meshutil.load_binding(
+                    self.binding_file_abspath(), fingerprints
+                )
+            if 0 < cache_bytes:
+                meshutil.binding_cache.put(binding_key, self.binding, cache_bytes)
+        elif 0 < cache_bytes:
+            self.binding = meshutil.binding_cache.get(binding_key)
+            self.profiler.info["binding_cache_hit"] = self.binding is not None
+        if self.binding is None:
+            if self.can_snapshot_source():
+                self.binding = self.prepare_snapshot(context)
+            else:
+                with self.profiler.phase("source_copy"):
+                    self.target_ob, self.source_ob, self.og_source_ob = (
+                        common.get_target_and_source_ob(context, copySource=True)
+                    )
+                compat.set_hide(self.og_source_ob, True)
+
+                self.binding = self.prepare_source(context)
+            if 0 < cache_bytes:
+                meshutil.binding_cache.put(binding_key, self.binding, cache_bytes)
+        if self.binding_file_mode == "SAVE":
+            with self.profiler.phase("binding_save"):
+                with common.open_temporary(self.binding_file_abspath(), "wb") as file:
+                    meshutil.save_binding(file, self.binding, fingerprints)
+        self.report_fan_in()
+
+        self.prepare_target(context)
+        self.start_iter(context)
+
+    def report_fan_in(self):
+        correspondence = self.binding.correspondence
+        if correspondence.is_nearest:
+            return
+        average, maximum = correspondence.fan_in()
+        self.profiler.info.update(fan_in_average=average, fan_in_max=maximum)
+        self.report(
+            type={"INFO"},
+            message=f_tip_(
+                "Source vertices per target vertex: {:.1f} on average, {} at most",
+                average,
+                maximum,
+            ),
+        )
+
+    def binding_params(self) -> tuple:
+        """Operator settings that change the binding, besides the meshes themselves."""
+        return (
+            self.bl_idname,
+            self.bind_method,
+            self.subdivide_number if self.bind_method == "SUBDIVIDE" else 0,
+            self.is_bind_current_mix,
+        )
+
+    def binding_fingerprints(self) -> dict:
+        """What a binding is made from, also stored in and checked against binding files."""
+        return {
+            "target": meshutil.object_fingerprint(self.target_ob, use_shape_keys=False),
+            "source": meshutil.object_fingerprint(
+                self.og_source_ob, use_key_values=self.is_bind_current_mix
+            ),
+            "settings": meshutil.fingerprint(self.binding_params(), self.target_subset),
+        }
+
+    def binding_file_abspath(self) -> str:
+        if not self.binding_filepath:
+            raise meshutil.BindingFileError("No binding file path")
+        return bpy.path.abspath(self.binding_filepath)
+
+    def read_target_subset(self):
+        """Indices of the target vertices to transfer to, None for all of them."""
+        target_me = self.target_ob.data
+        if self.target_restrict == "SELECTED":
+            is_selects = np.zeros(len(target_me.vertices), dtype=bool)
+            target_me.vertices.foreach_get("select", is_selects)
+            return np.flatnonzero(is_selects)
+        if self.target_restrict == "VERTEX_GROUP":
+            vertex_group = self.target_ob.vertex_groups.get(self.target_vertex_group)
+            if vertex_group is None:
+                return np.zeros(0, dtype=np.int64)
+            weights = meshutil.read_weights(target_me.vertices, [vertex_group.index])
+            return np.flatnonzero(0.0 < weights[:, 0])
+        return None
+
+    def prepare_subsets(self):
+        """Choose the target vertices to bind (self.target_subset) and to write
+        (self.write_subset). A preview binds only a voxel sample of them and
+        interpolates the rest through self.preview_map.
+        """
+        self.write_subset = self.read_target_subset()
+        self.target_subset = self.write_subset
+        self.preview_map = None
+        if not self.is_preview:
+            return
+
+        write_cos = self.read_target_cos()
+        samples = meshutil.voxel_sample(write_cos, self.preview_vertex_count)
+        if len(samples) == len(write_cos):
+            return
+        self.target_subset = (
+            samples if self.write_subset is None else self.write_subset[samples]
+        )
+
+        # Inverse distance weights of the nearest samples of every written vertex
+        sample_cos = write_cos[samples]
+        kd = mathutils.kdtree.KDTree(len(sample_cos))
+        for index, co in enumerate(sample_cos.tolist()):
+            kd.insert(co, index)
+        kd.balance()
+        neighbor_count = min(4, len(sample_cos))
+        indices = np.empty((len(write_cos), neighbor_count), dtype=np.int32)
+        dists = np.empty((len(write_cos), neighbor_count))
+        for vert_index, co in enumerate(write_cos.tolist()):
+            for i, (near_co, near_index, dist) in enumerate(
+                kd.find_n(co, neighbor_count)
+            ):
+                indices[vert_index, i] = near_index
+                dists[vert_index, i] = dist
+        weights = 1.0 / np.maximum(dists, 1e-12) ** 2
+        self.preview_map = meshutil.Correspondence(
+            np.arange(0, indices.size + 1, neighbor_count),
+            indices.ravel(),
+            weights.ravel(),
+            len(sample_cos),
+        )
+
+    def read_target_cos(self) -> np.ndarray:
+        """World space coordinates of the target vertices to transfer to."""
+        target_cos = meshutil.read_co(self.target_ob.data.vertices)
+        if self.target_subset is not None:
+            target_cos = target_cos[self.target_subset]
+        return meshutil.transform_co(self.target_ob.matrix_world, target_cos)
+
+    def can_snapshot_source(self) -> bool:
+        """Whether the source can be read as is, without a copy in the scene."""
+        is_subdivide = self.bind_method == "SUBDIVIDE" and 0 < self.subdivide_number
+        return not is_subdivide and (
+            not self.is_bind_current_mix or meshutil.can_read_mix_co(self.og_source_ob)
+        )
+
+    def prepare_snapshot(self, context) -> meshutil.TransferBinding:
+        """Bind the original source to the target without copying it."""
+        target_ob = self.target_ob
+        source_binding = self.snapshot_source(context)
+        with self.profiler.phase("neighbor_search") as record:
+            correspondence = self.make_correspondence(context)
+            record.verts += correspondence.target_count
+        with self.profiler.phase("transform"):
+            return source_binding.rebind(
+                correspondence,
+                compat.mul(
+                    target_ob.matrix_world.inverted_safe(),
+                    self.og_source_ob.matrix_world,
+                ),
+            )
+
+    def snapshot_source(self, context) -> meshutil.TransferBinding:
+        """Read the bind shape and shape keys of the original source into arrays
+        and index the bind shape like bind_source() does.
+
+        Returns the binding in the source's own space, without a correspondence.
+        """
+        source_ob = self.og_source_ob
+        source_me: bpy.types.Mesh = source_ob.data
+
+        source_key_blocks = list(source_me.shape_keys.key_blocks)
+        if self.is_bind_current_mix:
+            binded_co = meshutil.read_mix_co(source_ob)
+            kd_co = binded_co
+        else:
+            binded_co = meshutil.read_co(source_key_blocks[0].data)
+            kd_co = meshutil.read_co(source_me.vertices)
+
+        self.index_source(
+            meshutil.transform_co(source_ob.matrix_world, kd_co), source_me
+        )
+        with self.profiler.phase("key_read", keys=len(source_key_blocks)):
+            return meshutil.TransferBinding.from_shape_keys(
+                None, binded_co, source_key_blocks
+            )
+
+    def prepare_source(self, context) -> meshutil.TransferBinding:
+        """Bind the copied source to the target, see make_correspondence()."""
         target_ob = self.target_ob
         source_ob = self.source_ob
-        target_me: bpy.types.Mesh = self.target_ob.data
         source_me: bpy.types.Mesh = self.source_ob.data
-        print(f"prepare source_me = {source_me}")
-        print(f"prepare source_me.shape_keys = {source_me.shape_keys}")
 
         bpy.ops.object.select_all(action="DESELECT")
 
         compat.set_active(context, source_ob)
         compat.set_select(source_ob, select=True)
-        # compat.set_select(source_og_ob, False)
-        # compat.set_select(target_ob, False)
 
         if target_ob.matrix_world != source_ob.matrix_world:
-            print(f"prepare: transform")
             # transform source's mesh now so theres no need to worry about it later
-            matrix_source_to_target = compat.mul(
-                target_ob.matrix_world.inverted_safe(), source_ob.matrix_world
+            with self.profiler.phase("transform", verts=len(source_me.vertices)):
+                matrix_source_to_target = compat.mul(
+                    target_ob.matrix_world.inverted_safe(), source_ob.matrix_world
+                )
+                source_me.transform(matrix_source_to_target, shape_keys=True)
+                source_ob.matrix_world = target_ob.matrix_world
+
+        binded_co, source_key_blocks = self.bind_source(context)
+        with self.profiler.phase("neighbor_search") as record:
+            correspondence = self.make_correspondence(context)
+            record.verts += correspondence.target_count
+        with self.profiler.phase("key_read", keys=len(source_key_blocks)):
+            return meshutil.TransferBinding.from_shape_keys(
+                correspondence, binded_co, source_key_blocks
+            )
+
+    def bind_source(self, context):
+        """Subdivide the active source copy and index its bind shape in world
+        space, in self.kd or self.source_tris.
+
+        Returns the bind shape coordinates and the source shape keys.
+        """
+        source_ob = self.source_ob
+        source_me: bpy.types.Mesh = self.source_ob.data
+
+        if self.bind_method == "SUBDIVIDE" and 0 < self.subdivide_number:
+            with self.profiler.phase("subdivide") as record:
+                bpy.ops.object.mode_set(mode="EDIT")
+                bpy.ops.mesh.reveal()
+                bpy.ops.mesh.select_all(action="SELECT")
+                bpy.ops.mesh.subdivide(
+                    number_cuts=self.subdivide_number,
+                    smoothness=0.0,
+                    quadcorner="STRAIGHT_CUT",
+                    fractal=0.0,
+                    fractal_along_normal=0.0,
+                    seed=0,
+                )
+                bpy.ops.object.mode_set(mode="OBJECT")
+                record.verts += len(source_me.vertices)
+
+        source_key_blocks = list(source_me.shape_keys.key_blocks)
+        if self.is_bind_current_mix:
+            self.binded_shape_key = source_ob.shape_key_add(
+                name="__bind_shape_key", from_mix=True
             )
-            source_me.transform(matrix_source_to_target, shape_keys=True)
-            source_ob.matrix_world = target_ob.matrix_world
-
-        bpy.ops.object.mode_set(mode="EDIT")
-        bpy.ops.mesh.reveal()
-        bpy.ops.mesh.select_all(action="SELECT")
-        bpy.ops.mesh.subdivide(
-            number_cuts=self.subdivide_number,
-            smoothness=0.0,
-            quadcorner="STRAIGHT_CUT",
-            fractal=0.0,
-            fractal_along_normal=0.0,
-            seed=0,
+            binded_co = meshutil.read_co(self.binded_shape_key.data)
+            kd_co = binded_co
+        else:
+            binded_co = meshutil.read_co(source_key_blocks[0].data)
+            kd_co = meshutil.read_co(source_me.vertices)
+
+        self.index_source(
+            meshutil.transform_co(source_ob.matrix_world, kd_co), source_me
         )
-        bpy.ops.object.mode_set(mode="OBJECT")
+        return binded_co, source_key_blocks
+
+    def index_source(self, source_cos, source_me):
+        """Index the world space bind shape in self.kd, or self.source_tris for
+        the surface bind method.
+        """
+        with self.profiler.phase("kd_build", verts=len(source_cos)):
+            self.source_cos = source_cos
+            if self.bind_method == "SURFACE":
+                self.source_tris = meshutil.read_loop_triangles(source_me)
+                if not len(self.source_tris):
+                    self.report(
+                        type={"WARNING"},
+                        message="The source has no faces, binding to its vertices instead",
+                    )
+                    self.source_tris = None
+
+            if self.source_tris is None:
+                self.kd = mathutils.kdtree.KDTree(len(self.source_cos))
+                kd_insert = self.kd.insert
+                for index, co in enumerate(self.source_cos.tolist()):
+                    kd_insert(co, index)
+                self.kd.balance()
+
+    @abc.abstractmethod
+    def make_correspondence(self, context) -> meshutil.Correspondence:
+        """Map the source vertices in self.kd, or the source faces in
+        self.source_tris, to the target vertices.
+        """
+        ...
+
+    def find_near_surface(self, context, extend_range=1.0, max_neighbors=0):
+        """Find the source faces near each target vertex, see meshutil.find_near_surface()."""
+        target_cos = self.read_target_cos()
+
+        context.window_manager.progress_begin(0, len(target_cos))
+        progress_reduce = len(target_cos) // 200 + 1
+
+        def progress_update(vert_index):
+            if vert_index % progress_reduce == 0:
+                context.window_manager.progress_update(vert_index)
+
+        try:
+            return meshutil.find_near_surface(
+                self.source_cos,
+                self.source_tris,
+                target_cos,
+                extend_range,
+                progress_update,
+                max_neighbors,
+            )
+        finally:
+            context.window_manager.progress_end()
+
+    def prepare_target(self, context):
+        target_ob = self.target_ob
+        target_me: bpy.types.Mesh = self.target_ob.data
 
         if self.is_first_remove_all:
             try:
@@ -391,20 +803,13 @@ class shape_key_transfer_op(_op_base):
             target_ob.active_shape_key_index = 0
 
         if self.is_bind_current_mix:
-            source_basis = source_me.shape_keys.key_blocks[0]
-
             old_basis = (
                 target_me.shape_keys
                 and next(iter(target_me.shape_keys.key_blocks), False)
                 or target_ob.shape_key_add()
             )
             old_basis.name = "__old_basis__" + old_basis.name
-            new_basis = target_ob.shape_key_add(name=source_basis.name)
-
-            self.binded_shape_key = source_ob.shape_key_add(
-                name="__bind_shape_key", from_mix=True
-            )
-            self.source_bind_data = self.binded_shape_key.data
+            new_basis = target_ob.shape_key_add(name=self.binding.key_names[0])
 
             compat.set_active(context, target_ob)
             target_ob.active_shape_key_index = target_me.shape_keys.key_blocks.find(
@@ -417,54 +822,221 @@ class shape_key_transfer_op(_op_base):
 
             old_basis.relative_key = new_basis
 
-            source_ob.active_shape_key_index = source_me.shape_keys.key_blocks.find(
-                self.binded_shape_key.name
+    def start_iter(self, context):
+        """Start iterating the source shape keys of self.binding."""
+        self.key_indices = self.select_keys()
+        self.my_iter = iter(
+            transfer_shape_key_iter(
+                self.target_ob, self.binding, self.key_indices, self.is_quiet
             )
+        )
 
+        if self.is_batch:
+            self.batch_size = self.binding.correspondence.batch_size(
+                self.batch_memory_budget * 1024 * 1024
+            )
         else:
-            source_ob.active_shape_key_index = 0
-            self.source_bind_data = source_me.vertices
-
-        # print(len(source_ob.data.vertices), len(self.source_bind_data))
-        self.kd = mathutils.kdtree.KDTree(len(self.source_bind_data))
-        print(f"prepare {source_me.shape_keys}")
-        for index, vert in enumerate(self.source_bind_data):
-            co = compat.mul(source_ob.matrix_world, vert.co)
-            self.kd.insert(co, index)
-        self.kd.balance()
-
-        for i, key in enumerate(source_me.shape_keys.key_blocks):
-            if i == 0:
-                continue
-            else:
-                key.value = 0.0
+            self.batch_size = 1
 
-    @abc.abstractmethod
-    def loop(self, context) -> bool | None: ...
+        self.batch = None
+        self.row_index = 0
+        self._loop_start_time = time.perf_counter()
+        self.done_verts = 0
+        self.done_keys = 0
+
+        context.window_manager.progress_begin(
+            0, len(self.key_indices) * self.binding.correspondence.target_count
+        )
+        context.window_manager.progress_update(0)
+
+    def select_keys(self) -> list:
+        """Indices of the source keys to transfer, decided before any target key
+        is created. Keys without any delta are skipped when is_remove_empty,
+        unless the target already has them or a transferred key is relative to them.
+        """
+        key_names = self.binding.key_names
+        if self.is_preview:
+            # The basis too, so a target without shape keys doesn't get the
+            # previewed key as its basis
+            active_index = self.og_source_ob.active_shape_key_index
+            if active_index <= 0 or len(key_names) <= active_index:
+                active_index = min(1, len(key_names) - 1)
+            return sorted({0, active_index})
+        if not self.is_remove_empty:
+            return list(range(len(key_names)))
+
+        target_shape_keys = self.target_ob.data.shape_keys
+        target_key_names = (
+            set(target_shape_keys.key_blocks.keys()) if target_shape_keys else set()
+        )
+        is_keeps = 0.0 < self.binding.max_delta_norms()
+        is_keeps |= np.array([name in target_key_names for name in key_names], bool)
+        is_keeps[0] = True
+
+        name_indices = {name: i for i, name in enumerate(key_names)}
+        stack = np.flatnonzero(is_keeps).tolist()
+        while stack:
+            rel_index = name_indices.get(self.binding.relative_key_names[stack.pop()])
+            if rel_index is not None and not is_keeps[rel_index]:
+                is_keeps[rel_index] = True
+                stack.append(rel_index)
+
+        key_indices = np.flatnonzero(is_keeps).tolist()
+        # Summed over the targets of a batch transfer
+        info = self.profiler.info
+        info["skipped_keys"] = (
+            info.get("skipped_keys", 0) + len(key_names) - len(key_indices)
+        )
+        return key_indices
+
+    def loop(self, context) -> bool | None:
+        """Transfer the next chunk of target vertices, returns True when done.
+
+        Each call maps at most chunk_size target vertices * shape keys of the
+        current batch, so the caller can stop between chunks at any time.
+        """
+        if self.batch is None:
+            batch = list(itertools.islice(self.my_iter, self.batch_size))
+            if not batch:
+                context.window_manager.progress_end()
+                return True
+            self.start_batch(batch)
+
+        correspondence = self.binding.correspondence
+        target_count = correspondence.target_count
+        start = self.row_index
+        if len(self.source_diffs):
+            stop = min(
+                target_count,
+                start + max(1, self.chunk_size // len(self.source_diffs)),
+            )
+            self.near_diffs[:, start:stop] = correspondence.apply(
+                self.source_diffs, start, stop
+            )
+        else:
+            stop = target_count
+        self.row_index = stop
+        self.done_verts += (stop - start) * len(self.batch)
+
+        if target_count <= stop:
+            self.finish_batch()
+
+        context.window_manager.progress_update(self.done_verts)
+
+    def start_batch(self, batch):
+        self.batch = batch
+        self.is_moveds = [self.binding.is_moved(index) for index, _, _ in batch]
+        self.row_index = 0
+
+        # (K, N_src, 3) deltas of every moved source key in the batch
+        self.source_diffs = self.binding.diffs(
+            [
+                index
+                for (index, _, _), is_moved in zip(batch, self.is_moveds)
+                if is_moved
+            ]
+        )
+        self.near_diffs = np.empty(
+            (
+                len(self.source_diffs),
+                self.binding.correspondence.target_count,
+                3,
+            ),
+            dtype=meshutil.CO_DTYPE,
+        )
+
+    def finish_batch(self):
+        moved_index = 0
+        for (
+            source_shape_key_index,
+            target_shape_key,
+            target_shape_key_data,
+        ), is_moved in zip(self.batch, self.is_moveds):
+            is_changed = False
+            if is_moved:
+                key_diffs = self.near_diffs[moved_index]
+                moved_index += 1
+                if self.preview_map is not None:
+                    key_diffs = self.preview_map.apply(key_diffs)
+                is_writes = meshutil.stepped_mask(
+                    meshutil.moved_mask(key_diffs), self.step_size
+                )
+                is_changed = bool(is_writes.any())
+                if is_changed:
+                    target_cos = meshutil.read_co(target_shape_key_data)
+                    if self.write_subset is None:
+                        target_cos[is_writes] += key_diffs[is_writes]
+                    else:
+                        target_cos[self.write_subset[is_writes]] += key_diffs[is_writes]
+                    meshutil.write_co(target_shape_key_data, target_cos)
+
+            self.is_shapeds[target_shape_key.name] = (
+                self.is_shapeds.get(target_shape_key.name) or is_changed
+            )
+
+        self.done_keys += len(self.batch)
+        self.profiler.count(
+            "apply",
+            verts=self.binding.correspondence.target_count * len(self.batch),
+            keys=len(self.batch),
+        )
+        self.batch = None
+        self.is_moveds = None
+        self.source_diffs = None
+        self.near_diffs = None
+        self.my_iter.update()  # only call this when done with current iteration.
+
+    def update_status(self, context):
+        """Show the throughput and remaining time in the status bar."""
+        elapsed = time.perf_counter() - self._loop_start_time
+        if compat.IS_LEGACY or elapsed <= 0:
+            return
+        total_verts = len(self.key_indices) * self.binding.correspondence.target_count
+        verts_per_sec = self.done_verts / elapsed
+        remaining = (
+            (total_verts - self.done_verts) / verts_per_sec if verts_per_sec else 0.0
+        )
+        context.workspace.status_text_set(
+            f_tip_(
+                "Shape key transfer: {:,.0f} verts/s, {:.1f} keys/s, {:.0f} seconds left (ESC to cancel)",
+                verts_per_sec,
+                self.done_keys / elapsed,
+                remaining,
+            )
+        )
 
     def finish(self, context):
         target_me = self.target_ob.data
 
-        if self.is_remove_empty:
-            for source_shape_key_name, is_shaped in reversed(
-                list(self.is_shapeds.items())
-            ):
-                if not is_shaped:
-                    target_shape_key = target_me.shape_keys.key_blocks.get(
-                        source_shape_key_name
-                    )
-                    if not target_shape_key:
-                        continue
-                    key_blocks_values = target_me.shape_keys.key_blocks.values()
-                    is_used = False
-                    for key in key_blocks_values:
-                        if key.relative_key == target_shape_key:
-                            is_used = True
-                            break
-                    if not is_used:
-                        self.target_ob.shape_key_remove(target_shape_key)
+        if self.is_remove_empty and target_me.shape_keys:
+            with self.profiler.phase("empty_key_cleanup", keys=len(self.is_shapeds)):
+                key_blocks = target_me.shape_keys.key_blocks
+                # How many keys are relative to each key, counted once up front
+                relative_counts = collections.Counter(
+                    key.relative_key.name for key in key_blocks
+                )
+                for source_shape_key_name, is_shaped in reversed(
+                    list(self.is_shapeds.items())
+                ):
+                    if not is_shaped:
+                        target_shape_key = key_blocks.get(source_shape_key_name)
+                        if not target_shape_key:
+                            continue
+                        if not relative_counts[target_shape_key.name]:
+                            relative_counts[target_shape_key.relative_key.name] -= 1
+                            self.target_ob.shape_key_remove(target_shape_key)
 
         self.target_ob.active_shape_key_index = 0
+        if self.is_preview and target_me.shape_keys:
+            preview_index = target_me.shape_keys.key_blocks.find(
+                self.binding.key_names[self.key_indices[-1]]
+            )
+            if 0 < preview_index:
+                self.target_ob.active_shape_key_index = preview_index
+                target_me.shape_keys.key_blocks[preview_index].value = 1.0
+        if self.is_quiet:
+            # The key data was written without tagging the mesh, update it once
+            target_me.update()
 
     def cancel(self, context):
         report_type = (self.is_canceled == "WARNING" and "WARNING") or "ERROR"
@@ -472,16 +1044,25 @@ class shape_key_transfer_op(_op_base):
             type={report_type},
             message="Shape key transfer canceled. Results may not be as expected. Use Undo / Ctrl Z to revert changes",
         )
+        if self.is_quiet and self.target_ob:
+            self.target_ob.data.update()
         self.cleanup(context)
 
     def cleanup(self, context):
+        if self.profiler:
+            with self.profiler.phase("teardown"):
+                self.teardown(context)
+            self.end_profile()
+        else:
+            self.teardown(context)
+
+    def teardown(self, context):
         if self.target_ob:
             compat.set_active(context, self.target_ob)
 
         if self.og_source_ob:
             compat.set_hide(self.og_source_ob, False)
 
-        print(f"Remove {self.source_ob}")
         source_me = self.source_ob and self.source_ob.data
         if source_me:
             common.remove_data([self.source_ob, source_me])
@@ -491,6 +1072,8 @@ class shape_key_transfer_op(_op_base):
         if self._timer:
             wm = context.window_manager
             wm.event_timer_remove(self._timer)
+            if not compat.IS_LEGACY:
+                context.workspace.status_text_set(None)
 
         if self.pre_mode and context.object:
             bpy.ops.object.mode_set(mode=self.pre_mode)
@@ -509,8 +1092,59 @@ class shape_key_transfer_op(_op_base):
 
         self.binded_shape_key = None
         self.kd = None
+        self.source_cos = None
+        self.source_tris = None
+        self.target_subset = None
+        self.write_subset = None
+        self.preview_map = None
         self.is_shapeds = {}
 
+        if self.my_iter:
+            self.my_iter.free()
+        self.my_iter = None
+        self.key_indices = None
+        self.binding = None
+        self.batch_size = 1
+        self.batch = None
+        self.is_moveds = None
+        self.source_diffs = None
+        self.near_diffs = None
+
+    def start_profile(self, target_obs):
+        prefs = common.preferences()
+        self.profiler = profiler.Profiler(
+            self.bl_idname, trace_memory=prefs.is_profile_transfer
+        )
+        source_me = self.og_source_ob.data
+        self.profiler.info.update(
+            source=self.og_source_ob.name,
+            source_verts=len(source_me.vertices),
+            source_keys=(
+                len(source_me.shape_keys.key_blocks) if source_me.shape_keys else 0
+            ),
+            targets=[ob.name for ob in target_obs],
+            target_verts=sum(len(ob.data.vertices) for ob in target_obs),
+        )
+
+    def end_profile(self):
+        """Log the profile and report its summary, as set in the preferences."""
+        prefs = common.preferences()
+        run_profiler = self.profiler
+        self.profiler = None
+
+        run_profiler.stop()
+        run_profiler.info["canceled"] = bool(self.is_canceled)
+        if prefs.is_profile_transfer:
+            try:
+                run_profiler.write_log(profile_log_path())
+            except OSError:
+                traceback.print_exc()
+        if prefs.is_report_profile:
+            self.report(
+                type={"INFO"},
+                message=f_tip_("Slowest phases: {}", run_profiler.summary()),
+            )
+
 
 @compat.BlRegister()
 class CNV_OT_quick_shape_key_transfer(shape_key_transfer_op, bpy.types.Operator):
@@ -531,9 +1165,6 @@ class CNV_OT_quick_shape_key_transfer(shape_key_transfer_op, bpy.types.Operator)
         step=1,
     )
 
-    near_vert_indexs = []
-    my_iter = None
-
     @classmethod
     def poll(cls, context):
         obs = context.selected_objects
@@ -553,83 +1184,21 @@ class CNV_OT_quick_shape_key_transfer(shape_key_transfer_op, bpy.types.Operator)
         shape_key_transfer_op.draw(self, context)
         self.layout.prop(self, "step_size")
 
-    def prepare(self, context):
-        super().prepare(context)
-
-        target_me = self.target_ob.data
-        source_me = self.source_ob.data
-
-        self.near_vert_indexs = list(range(len(target_me.vertices)))
-
-        for v in target_me.vertices:
-            near_co = compat.mul(self.target_ob.matrix_world, v.co)  # v.co
-            self.near_vert_indexs[v.index] = self.kd.find(near_co)[1]
-
-        self.my_iter = iter(
-            transfer_shape_key_iter(
-                self.target_ob, self.source_ob, self.binded_shape_key
-            )
+    def make_correspondence(self, context):
+        if self.source_tris is not None:
+            indptr, indices, dists, mini_dists, barys = self.find_near_surface(context)
+            return meshutil.Correspondence(indptr, indices, barys, len(self.source_cos))
+
+        target_cos = self.read_target_cos()
+        kd_find = self.kd.find
+        near_vert_indexs = np.fromiter(
+            (kd_find(co)[1] for co in target_cos.tolist()),
+            dtype=np.int32,
+            count=len(target_cos),
         )
-        context.window_manager.progress_begin(
-            0, len(source_me.shape_keys.key_blocks) * len(target_me.vertices)
+        return meshutil.Correspondence.from_nearest(
+            near_vert_indexs, len(self.source_cos)
         )
-        context.window_manager.progress_update(0)
-
-    def loop(self, context):
-        (
-            source_shape_key_index,
-            target_shape_key,
-            binded_shape_key_data,
-            source_shape_key_data,
-            target_shape_key_data,
-        ) = next(self.my_iter, (-1, None, None, None, None))
-        # print(source_shape_key_index, target_shape_key, binded_shape_key_data, source_shape_key_data, target_shape_key_data)
-        if not target_shape_key:
-            context.window_manager.progress_end()
-            return True
-
-        progress = source_shape_key_index * len(self.target_ob.data.vertices)
-
-        def check(index):
-            near_vert_index = self.near_vert_indexs[index]
-            near_shape_co = (
-                source_shape_key_data[near_vert_index].co
-                - binded_shape_key_data[near_vert_index].co
-            )
-
-            context.window_manager.progress_update(progress + index)
-
-            if abs(near_shape_co.length) > 2e-126:  # 2e-126 is the smallest float != 0
-                target_shape_key_data[index].co += near_shape_co
-                return True
-
-        is_changed = False
-        just_changed = False
-        found_more = False
-        for i in range(0, len(target_shape_key_data), self.step_size):
-            if check(i) or found_more:
-                is_changed = True
-                found_more = False
-                if not just_changed:
-                    for j in range(i - self.step_size + 1, i):
-                        if j < len(target_shape_key_data) and j > 0:
-                            found_more = check(j) or found_more
-                for k in range(i + 1, i + self.step_size):
-                    if k < len(target_shape_key_data) and k > 0:
-                        found_more = check(k) or found_more
-                just_changed = True
-            else:
-                just_changed = False
-
-        if not self.is_shapeds.get(target_shape_key.name):
-            self.is_shapeds[target_shape_key.name] = is_changed
-        self.my_iter.update()  # only call this when done with current iteration.
-
-    def cleanup(self, context):
-        self.near_vert_indexs = []
-        self.my_iter.free()
-        self.my_iter = None
-        shape_key_transfer_op.cleanup(self, context)
 
 
 @compat.BlRegister()
@@ -658,14 +1227,15 @@ class CNV_OT_precision_shape_key_transfer(shape_key_transfer_op, bpy.types.Opera
         step=10,
         precision=2,
     )
-
-    near_vert_data = []
-    near_vert_multi_total = []
-    my_iter = None
-
-    # source_raw_data = None
-    # binded_raw_data = None
-    # target_raw_data = None
+    max_neighbors = bpy.props.IntProperty(
+        name="Max neighbors",
+        description="Blend at most this many nearest source vertices per target vertex, 0 for no limit",
+        default=0,
+        min=0,
+        max=1024,
+        soft_min=0,
+        soft_max=256,
+    )
 
     @classmethod
     def poll(cls, context):
@@ -686,6 +1256,7 @@ class CNV_OT_precision_shape_key_transfer(shape_key_transfer_op, bpy.types.Opera
         shape_key_transfer_op.draw(self, context)
         self.layout.prop(self, "step_size")
         self.layout.prop(self, "extend_range", icon="PROP_ON")
+        self.layout.prop(self, "max_neighbors", icon="STICKY_UVS_LOC")
 
     def xexecute(self, context):
         start_time = time.time()
@@ -794,172 +1365,64 @@ class CNV_OT_precision_shape_key_transfer(shape_key_transfer_op, bpy.types.Opera
         self.report(type={"INFO"}, message=f_tip_("{:.2f} Seconds", diff_time))
         return {"FINISHED"}
 
-    def prepare(self, context):
-        super().prepare(context)
-
-        target_me = self.target_ob.data
-        source_me = self.source_ob.data
-
-        context.window_manager.progress_begin(0, len(target_me.vertices))
-        progress_reduce = len(target_me.vertices) // 200 + 1
-        self.near_vert_data = []
-        self.near_vert_multi_total = []
-        near_vert_multi_total_append = self.near_vert_multi_total.append
-
-        for vert in target_me.vertices:
-            new_vert_data = []
-            self.near_vert_data.append(new_vert_data)
-            self.near_vert_data_append = new_vert_data.append
-
-            target_co = compat.mul(self.target_ob.matrix_world, vert.co)  # vert.co
-            mini_co, mini_index, mini_dist = self.kd.find(target_co)
-            radius = mini_dist * self.extend_range
-            diff_radius = radius - mini_dist
-
-            multi_total = 0.0
-            for co, index, dist in self.kd.find_range(target_co, radius):
-                if 0 < diff_radius:
-                    multi = (diff_radius - (dist - mini_dist)) / diff_radius
-                else:
-                    multi = 1.0
-                self.near_vert_data_append((index, multi))
-                multi_total += multi
-            near_vert_multi_total_append(multi_total)
-
-            if vert.index % progress_reduce == 0:
-                context.window_manager.progress_update(vert.index)
-        context.window_manager.progress_end()
+    def binding_params(self):
+        return super().binding_params() + (self.extend_range, self.max_neighbors)
 
-        self.my_iter = iter(
-            transfer_shape_key_iter(
-                self.target_ob, self.source_ob, binded_shape_key=self.binded_shape_key
+    def make_correspondence(self, context):
+        if self.source_tris is not None:
+            indptr, indices, dists, mini_dists, barys = self.find_near_surface(
+                context, self.extend_range, self.max_neighbors
             )
+        else:
+            indptr, indices, dists, mini_dists = self.find_near_verts(context)
+            barys = 1.0
+        multis = (
+            meshutil.falloff_weights(indptr, dists, mini_dists, self.extend_range)
+            * barys
         )
-
-        # self.source_raw_data = numpy.ndarray(shape=(len(source_me.vertices), 3), dtype=float, order='C')
-        # self.target_raw_data = numpy.ndarray(shape=(len(target_me.vertices), 3), dtype=float, order='C')
-
-        # self.binded_raw_data = numpy.ndarray(shape=len(self.source_bind_data)*3, dtype=float, order='C')
-        # self.source_bind_data.foreach_get('co', self.binded_raw_data)
-        # self.binded_raw_data.resize(self.binded_raw_data.size//3, 3)
-
-        context.window_manager.progress_begin(
-            0, len(source_me.shape_keys.key_blocks) * len(target_me.vertices)
-        )
-        context.window_manager.progress_update(0)
-
-    def loop(self, context):
-        # bpy.ops.object.mode_set(mode='OBJECT')
-        (
-            source_shape_key_index,
-            target_shape_key,
-            binded_shape_key_data,
-            source_shape_key_data,
-            target_shape_key_data,
-        ) = next(self.my_iter, (-1, None, None, None, None))
-        if not target_shape_key:
-            context.window_manager.progress_end()
-            return True
-
-        # print("Loop for " + target_shape_key.name)
-
-        # context.window_manager.progress_begin( 0, len(self.source_ob.shape_keys.key_blocks) * len(target_ob.data.vertices) )
-        progress = source_shape_key_index * len(self.target_ob.data.vertices)
-        # context.window_manager.progress_update( progress )
-
-        diff_data = [None] * len(source_shape_key_data)
-        near_diff_co = mathutils.Vector.Fill(
-            3, 0
-        )  # Creates a vector of length 3 filled with 0's
-
-        def check(index, near_diff_co=near_diff_co):
-            near_diff_co.zero()  # This should be faster than creating a new vector every time
-
-            if self.near_vert_multi_total[index] > 0:
-                for near_index, near_multi in self.near_vert_data[index]:
-                    diff_data[near_index] = (
-                        diff_data[near_index]
-                        or source_shape_key_data[near_index].co
-                        - binded_shape_key_data[near_index].co
-                    )
-                    near_diff_co += diff_data[near_index] * near_multi
-
-                near_diff_co /= self.near_vert_multi_total[index]
-
-            context.window_manager.progress_update(progress + index)
-
-            if near_diff_co.length > 2e-126:  # 2e-126 is the smallest float != 0
-                target_shape_key_data[index].co += near_diff_co
-                return True
-
-        is_changed = False
-        just_changed = False
-        if self.step_size > 1:
-            found_more = False
-            for i in range(0, len(target_shape_key_data), self.step_size):
-                if check(i) or found_more:
-                    is_changed = True
-                    found_more = False
-                    if not just_changed:
-                        for j in range(i - self.step_size + 1, i):
-                            if j < len(target_shape_key_data) and j > 0:
-                                found_more = check(j) or found_more
-                    for k in range(i + 1, i + self.step_size):
-                        if k < len(target_shape_key_data) and k > 0:
-                            found_more = check(k) or found_more
-                    just_changed = True
-                else:
-                    just_changed = False
-
-        else:  # if self.step_size == 1:
-            for index, binded_vert, source_vert in zip(
-                range(len(diff_data)), binded_shape_key_data, source_shape_key_data
-            ):
-                diff_data[index] = source_vert.co - binded_vert.co
-                if diff_data[index].length > 2e-126:
-                    just_changed = True
-
-            if just_changed:
-                for target_vert, near_indices, near_total in zip(
-                    target_shape_key_data,
-                    self.near_vert_data,
-                    self.near_vert_multi_total,
-                ):
-                    near_diff_co.zero()  # This should be faster than creating a new vector every time
-
-                    if near_total > 0:
-                        for near_index, near_multi in near_indices:
-                            near_diff_co += diff_data[near_index] * near_multi
-
-                        near_diff_co /= near_total
-
-                    if (
-                        near_diff_co.length > 2e-126
-                    ):  # 2e-126 is the smallest float != 0
-                        target_vert.co += near_diff_co
-                        is_changed = True
-
-                    progress += 1
-                    context.window_manager.progress_update(progress)
+        return meshutil.Correspondence(indptr, indices, multis, len(self.source_cos))
+
+    def find_near_verts(self, context):
+        """Find the source vertices within extend_range of each target vertex,
+        only the max_neighbors nearest of them when it is set.
+
+        Returns CSR rows (indptr, indices), the distance of every neighbor
+        and the nearest distance of every row.
+        """
+        target_cos = self.read_target_cos()
+
+        context.window_manager.progress_begin(0, len(target_cos))
+        progress_reduce = len(target_cos) // 200 + 1
+
+        kd_find = self.kd.find
+        kd_find_n = self.kd.find_n
+        kd_find_range = self.kd.find_range
+        max_neighbors = self.max_neighbors
+
+        indptr = [0]
+        indices = []
+        dists = []
+        mini_dists = []
+        for vert_index, target_co in enumerate(target_cos.tolist()):
+            mini_co, mini_index, mini_dist = kd_find(target_co)
+            radius = mini_dist * self.extend_range
+            if max_neighbors:
+                neighbors = kd_find_n(target_co, max_neighbors)
             else:
-                context.window_manager.progress_update(
-                    progress + len(target_shape_key_data)
-                )
+                neighbors = kd_find_range(target_co, radius)
+            for co, index, dist in neighbors:
+                if radius < dist:
+                    continue
+                indices.append(index)
+                dists.append(dist)
+            indptr.append(len(indices))
+            mini_dists.append(mini_dist)
 
-        self.is_shapeds[target_shape_key.name] = (
-            self.is_shapeds.get(target_shape_key.name) or is_changed
-        )
-        self.my_iter.update()  # only call this when done with current iteration.
-        # bpy.ops.object.mode_set(mode='SCULPT') # Preview shape keys while transfering
+            if vert_index % progress_reduce == 0:
+                context.window_manager.progress_update(vert_index)
+        context.window_manager.progress_end()
 
-    def cleanup(self, context):
-        self.near_vert_data = []
-        self.near_vert_multi_total = []
-        self.my_iter = None
-        # self.source_raw_data = None
-        # self.binded_raw_data = None
-        # self.target_raw_data = None
-        shape_key_transfer_op.cleanup(self, context)
+        return indptr, indices, dists, mini_dists
 
 
 """
@@ -989,7 +1452,6 @@ class CNV_PT_vgroups_selector(bpy.types.Panel):
     def draw(self, context):
         target_ob, source_ob = common.get_target_and_source_ob(context)
         matched_vgroups = common.values_of_matched_keys(target_ob.vertex_groups, source_ob.vertex_groups)
-        print(f_("len(matched) = {length}", length=len(matched_vgroups)))
         armature = target_ob.find_armature() or source_ob.find_armature()
         armature = armature and armature.data
         bone_data_ob = (target_ob.get("LocalBoneData:0") and target_ob) or (source_ob.get("LocalBoneData:0") and source_ob) or False
@@ -1004,12 +1466,10 @@ class CNV_PT_vgroups_selector(bpy.types.Panel):
             elif bone_data_ob:
                 is_used = bool( vg_name in local_bone_names )
                 
-            print(vg_name)
             is_vgroups_used[vg_name] = bpy.props.BoolProperty(name=vg_name, default=is_used)
             self.layout.prop( self, vg_name )
     
     def __getattr__(self, attr):
-        print(f_("get attr {key}", key=attr))
         if attr == 'matched_vgroups':
             return matched_vgroups
         if attr == 'is_vgroups_used':
@@ -1027,7 +1487,6 @@ class CNV_PT_vgroups_selector(bpy.types.Panel):
             return
         if attr == 'layout':
             bpy.types.Panel.__setattribute__(self, attr, value)
-        print(f_("set attr {key} = {val}", key=attr, val=value))
         is_vgroups_used[attr] = value
 """
 
@@ -1360,12 +1819,19 @@ class CNV_OT_weighted_shape_key_transfer(shape_key_transfer_op, bpy.types.Operat
         step=10,
         precision=2,
     )
-
-    near_vert_data = []
-    near_vert_multi_total = []
-    my_iter = None
+    max_neighbors = bpy.props.IntProperty(
+        name="Max neighbors",
+        description="Blend at most this many nearest source vertices per target vertex, 0 for no limit",
+        default=0,
+        min=0,
+        max=1024,
+        soft_min=0,
+        soft_max=256,
+    )
 
     matched_vgroups = []
+    # Matched weights by object name, while preparing
+    matched_weights = None
     using_vgroups = bpy.props.CollectionProperty(type=common.CNV_SelectorItem)
     active_vgroup = bpy.props.IntProperty(name="Active Vertex Group")
 
@@ -1393,7 +1859,6 @@ class CNV_OT_weighted_shape_key_transfer(shape_key_transfer_op, bpy.types.Operat
         self.matched_vgroups = common.values_of_matched_keys(
             target_ob.vertex_groups, source_ob.vertex_groups
         )
-        print(f_("len(matched) = {length}", length=len(self.matched_vgroups)))
         armature_ob = target_ob.find_armature() or source_ob.find_armature()
         self.armature = armature_ob and armature_ob.data
         self.bone_data_ob = (
@@ -1408,7 +1873,6 @@ class CNV_OT_weighted_shape_key_transfer(shape_key_transfer_op, bpy.types.Operat
             if self.using_vgroups.get(vg_name):
                 continue
 
-            print(index, vg_name)
             new_prop = self.using_vgroups.add()
             new_prop.name = vg_name
             new_prop.index = index
@@ -1419,93 +1883,230 @@ class CNV_OT_weighted_shape_key_transfer(shape_key_transfer_op, bpy.types.Operat
         )
         self.layout.label(text="Show filters", icon="FILE_PARENT")
 
-    def prepare(self, context):
-        shape_key_transfer_op.prepare(self, context)
+    def binding_params(self):
+        return shape_key_transfer_op.binding_params(self) + (
+            self.extend_range,
+            self.max_neighbors,
+            tuple((vg.name, vg.value) for vg in self.using_vgroups),
+            self.read_matched_weights(self.target_ob),
+            self.read_matched_weights(self.og_source_ob),
+        )
 
-        target_me = self.target_ob.data
-        source_me = self.source_ob.data
+    def prepare(self, context):
+        # The fingerprints and the correspondence read the same weights
+        self.matched_weights = {}
+        try:
+            shape_key_transfer_op.prepare(self, context)
+        finally:
+            self.matched_weights = None
 
-        self.matched_vgroups = [
-            (
-                self.target_ob.vertex_groups.get(vg.name),
-                self.source_ob.vertex_groups.get(vg.name),
-            )
+    def read_matched_weights(self, ob):
+        if self.matched_weights is not None and ob.name in self.matched_weights:
+            return self.matched_weights[ob.name]
+        group_indices = [
+            ob.vertex_groups[vg.name].index if vg.name in ob.vertex_groups else -1
             for vg in self.using_vgroups
         ]
+        weights = meshutil.read_weights(ob.data.vertices, group_indices)
+        if self.matched_weights is not None:
+            self.matched_weights[ob.name] = weights
+        return weights
+
+    def make_correspondence(self, context):
+        if self.source_tris is not None:
+            indptr, indices, dists, mini_dists, barys = self.find_near_surface(
+                context, self.extend_range, self.max_neighbors
+            )
+        else:
+            indptr, indices, dists, mini_dists = self.find_near_verts(context)
+            barys = 1.0
+        multis = (
+            meshutil.falloff_weights(indptr, dists, mini_dists, self.extend_range)
+            * barys
+        )
 
-        context.window_manager.progress_begin(0, len(target_me.vertices))
-        progress_reduce = len(target_me.vertices) // 200 + 1
-        self.near_vert_data = []
-        self.near_vert_multi_total = []
-        near_vert_multi_total_append = self.near_vert_multi_total.append
+        target_weights = self.read_matched_weights(self.target_ob)
+        if self.target_subset is not None:
+            target_weights = target_weights[self.target_subset]
+        rows = np.repeat(np.arange(len(target_weights)), np.diff(indptr))
+        multis *= meshutil.weight_match(
+            target_weights,
+            self.read_matched_weights(self.source_ob or self.og_source_ob),
+            rows,
+            np.asarray(indices, dtype=np.int64),
+        )
 
-        for vert in target_me.vertices:
-            new_vert_data = []
-            self.near_vert_data.append(new_vert_data)
-            self.near_vert_data_append = new_vert_data.append
+        return meshutil.Correspondence(indptr, indices, multis, len(self.source_cos))
 
-            target_co = compat.mul(self.target_ob.matrix_world, vert.co)  # vert.co
-            mini_co, mini_index, mini_dist = self.kd.find(target_co)
-            radius = mini_dist * self.extend_range
-            diff_radius = radius - mini_dist
-
-            multi_total = 0.0
-            for co, index, dist in self.kd.find_range(target_co, radius):
-                if 0 < diff_radius:
-                    multi = (diff_radius - (dist - mini_dist)) / diff_radius
-                else:
-                    multi = 1.0
-
-                avg_weight_match = 0
-                for target_vg, source_vg in self.matched_vgroups:
-                    target_weight = 0
-                    try:
-                        target_weight = target_vg.weight(vert.index)
-                    except:
-                        pass
-                    source_weight = 0
-                    try:
-                        source_weight = source_vg.weight(index)
-                    except:
-                        pass
-                    avg_weight_match += (
-                        -abs(source_weight - target_weight) + target_weight
+    invoke = CNV_OT_precision_shape_key_transfer.invoke
+    find_near_verts = CNV_OT_precision_shape_key_transfer.find_near_verts
+
+
+@compat.BlRegister()
+class CNV_OT_batch_shape_key_transfer(shape_key_transfer_op, bpy.types.Operator):
+    bl_idname = "object.batch_shape_key_transfer"
+    bl_label = "Batch shape key transfer"
+    bl_description = "Transfers the shape keys of the active mesh to every other selected mesh, preparing the source only once"
+    bl_options = {"REGISTER", "UNDO"}
+
+    is_multi_target = True
+
+    items = [
+        ("QUICK", "Quick", "", "MOD_DATA_TRANSFER", 1),
+        ("PRECISION", "Spatial blur", "", "MOD_MESHDEFORM", 2),
+    ]
+    method = bpy.props.EnumProperty(items=items, name="Method", default="PRECISION")
+    step_size = bpy.props.IntProperty(
+        name="Step Size (low = quality, high = speed)",
+        default=1,
+        min=1,
+        max=100,
+        soft_min=1,
+        soft_max=10,
+        step=1,
+    )
+    extend_range = bpy.props.FloatProperty(
+        name="Range magnification",
+        default=1.1,
+        min=1.0001,
+        max=5.0,
+        soft_min=1.0001,
+        soft_max=5.0,
+        step=10,
+        precision=2,
+    )
+    max_neighbors = bpy.props.IntProperty(
+        name="Max neighbors",
+        description="Blend at most this many nearest source vertices per target vertex, 0 for no limit",
+        default=0,
+        min=0,
+        max=1024,
+        soft_min=0,
+        soft_max=256,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        active_ob = context.active_object
+        if not active_ob or active_ob.type != "MESH" or not active_ob.data.shape_keys:
+            return False
+        for ob in context.selected_objects:
+            if ob.type == "MESH" and ob != active_ob:
+                return True
+        return False
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def draw(self, context):
+        self.layout.prop(self, "method", icon="SNAP_ON")
+        shape_key_transfer_op.draw(self, context)
+        self.layout.prop(self, "step_size")
+        sub = self.layout.row()
+        sub.active = self.method == "PRECISION"
+        sub.prop(self, "extend_range", icon="PROP_ON")
+        sub.prop(self, "max_neighbors", icon="STICKY_UVS_LOC")
+
+    def execute(self, context):
+        start_time = time.time()
+
+        self.pre_selected = list(context.selected_objects)
+        self.pre_mode = context.mode
+        self.og_source_ob = context.active_object
+        target_obs = [
+            ob
+            for ob in self.pre_selected
+            if ob.type == "MESH" and ob != self.og_source_ob
+        ]
+        self.start_profile(target_obs)
+
+        bpy.ops.object.mode_set(mode="OBJECT")
+
+        self.binded_shape_key = None
+        self.kd = None
+        self.source_cos = None
+        self.source_tris = None
+        self.target_subset = None
+        self.write_subset = None
+        self.preview_map = None
+
+        try:
+            # The source is bound once in its own space, deltas are mapped to
+            # each target's space afterwards.
+            if self.can_snapshot_source():
+                source_binding = self.snapshot_source(context)
+            else:
+                with self.profiler.phase("source_copy"):
+                    self.source_ob = self.og_source_ob.copy()
+                    self.source_ob.data = self.og_source_ob.data.copy()
+                    compat.link(context.scene, self.source_ob)
+                compat.set_hide(self.og_source_ob, True)
+
+                bpy.ops.object.select_all(action="DESELECT")
+                compat.set_active(context, self.source_ob)
+                compat.set_select(self.source_ob, select=True)
+
+                binded_co, source_key_blocks = self.bind_source(context)
+                with self.profiler.phase("key_read", keys=len(source_key_blocks)):
+                    source_binding = meshutil.TransferBinding.from_shape_keys(
+                        None, binded_co, source_key_blocks
                     )
-                if avg_weight_match > 1:
-                    avg_weight_match = 1
-                elif avg_weight_match < 0:
-                    avg_weight_match = 0
-
-                multi *= avg_weight_match
-                self.near_vert_data_append((index, multi))
-                multi_total += multi
-            near_vert_multi_total_append(multi_total)
-
-            if vert.index % progress_reduce == 0:
-                context.window_manager.progress_update(vert.index)
-        context.window_manager.progress_end()
 
-        self.my_iter = iter(
-            transfer_shape_key_iter(
-                self.target_ob, self.source_ob, binded_shape_key=self.binded_shape_key
-            )
-        )
+            for target_ob in target_obs:
+                self.target_ob = target_ob
+                self.is_shapeds = {}
+                compat.set_active(context, target_ob)
 
-        # self.source_raw_data = numpy.ndarray(shape=(len(source_me.vertices), 3), dtype=float, order='C')
-        # self.target_raw_data = numpy.ndarray(shape=(len(target_me.vertices), 3), dtype=float, order='C')
+                matrix = compat.mul(
+                    target_ob.matrix_world.inverted_safe(),
+                    self.og_source_ob.matrix_world,
+                )
+                self.prepare_subsets()
+                with self.profiler.phase("neighbor_search") as record:
+                    correspondence = self.make_correspondence(context)
+                    record.verts += correspondence.target_count
+                self.binding = source_binding.rebind(correspondence, matrix)
+
+                self.prepare_target(context)
+                self.start_iter(context)
+                is_finished = False
+                while not is_finished:
+                    with self.profiler.phase("apply"):
+                        is_finished = self.loop(context)
+                self.finish(context)
 
-        # self.binded_raw_data = numpy.ndarray(shape=len(self.source_bind_data)*3, dtype=float, order='C')
-        # self.source_bind_data.foreach_get('co', self.binded_raw_data)
-        # self.binded_raw_data.resize(self.binded_raw_data.size//3, 3)
+                self.my_iter.free()
+                self.my_iter = None
+        finally:
+            self.target_ob = self.og_source_ob
+            self.cleanup(context)
 
-        context.window_manager.progress_begin(
-            0, len(source_me.shape_keys.key_blocks) * len(target_me.vertices)
-        )
-        context.window_manager.progress_update(0)
+        diff_time = time.time() - start_time
+        self.report(type={"INFO"}, message=f_tip_("{:.2f} Seconds", diff_time))
+        return {"FINISHED"}
 
-    invoke = CNV_OT_precision_shape_key_transfer.invoke
-    loop = CNV_OT_precision_shape_key_transfer.loop
-    cleanup = CNV_OT_precision_shape_key_transfer.cleanup
+    def make_correspondence(self, context):
+        if self.method == "QUICK":
+            return CNV_OT_quick_shape_key_transfer.make_correspondence(self, context)
+        return CNV_OT_precision_shape_key_transfer.make_correspondence(self, context)
+
+    find_near_verts = CNV_OT_precision_shape_key_transfer.find_near_verts
+
+
+def shape_key_range(ob, mode: str) -> list:
+    """Shape keys of `ob` for an ACTIVE/UP/DOWN/ALL range around the active key.
+
+    UP and DOWN include the active key itself.
+    """
+    key_blocks = ob.data.shape_keys.key_blocks
+    active_index = ob.active_shape_key_index
+    if mode == "ACTIVE":
+        return [key_blocks[active_index]]
+    elif mode == "UP":
+        return list(key_blocks[: active_index + 1])
+    elif mode == "DOWN":
+        return list(key_blocks[active_index:])
+    return list(key_blocks)
 
 
 @compat.BlRegister()
@@ -1533,6 +2134,11 @@ class CNV_OT_multiply_shape_key(bpy.types.Operator):
         ("ALL", "全て", "", "ARROW_LEFTRIGHT", 4),
     ]
     mode = bpy.props.EnumProperty(items=items, name="対象", default="ACTIVE")
+    is_relative_key = bpy.props.BoolProperty(
+        name="Relative to each key's relative key",
+        default=False,
+        description="Scale the deformation of each key against its own relative key instead of the mesh basis",
+    )
 
     @classmethod
     def poll(cls, context):
@@ -1548,35 +2154,40 @@ class CNV_OT_multiply_shape_key(bpy.types.Operator):
     def draw(self, context):
         self.layout.prop(self, "multi", icon="ARROW_LEFTRIGHT")
         self.layout.prop(self, "mode", icon="VIEWZOOM")
+        self.layout.prop(self, "is_relative_key", icon="SHAPEKEY_DATA")
 
     def execute(self, context):
         ob = context.active_object
         me = ob.data
-        shape_keys = me.shape_keys
         pre_mode = ob.mode
         bpy.ops.object.mode_set(mode="OBJECT")
 
-        target_shapes = []
-        if self.mode == "ACTIVE":
-            target_shapes.append(ob.active_shape_key)
-        elif self.mode == "UP":
-            for index, key_block in enumerate(shape_keys.key_blocks):
-                if index <= ob.active_shape_key_index:
-                    target_shapes.append(key_block)
-        elif self.mode == "UP":
-            for index, key_block in enumerate(shape_keys.key_blocks):
-                if ob.active_shape_key_index <= index:
-                    target_shapes.append(key_block)
-        elif self.mode == "ALL":
-            for key_block in shape_keys.key_blocks:
-                target_shapes.append(key_block)
+        target_shapes = shape_key_range(ob, self.mode)
+
+        # Read every relative shape before writing any key, since a key in the
+        # range may be the relative key of another one
+        base_co = meshutil.read_co(me.vertices)
+        relative_cos = {}
+        if self.is_relative_key:
+            for shape in target_shapes:
+                relative_key = shape.relative_key
+                if relative_key.name not in relative_cos:
+                    relative_cos[relative_key.name] = meshutil.read_co(
+                        relative_key.data
+                    )
 
         for shape in target_shapes:
-            data = shape.data
-            for i, vert in enumerate(me.vertices):
-                diff = data[i].co - vert.co
-                diff *= self.multi
-                data[i].co = vert.co + diff
+            if self.is_relative_key:
+                if shape.relative_key == shape:
+                    continue
+                relative_co = relative_cos[shape.relative_key.name]
+            else:
+                relative_co = base_co
+            co = meshutil.read_co(shape.data)
+            co -= relative_co
+            co *= self.multi
+            co += relative_co
+            meshutil.write_co(shape.data, co)
         bpy.ops.object.mode_set(mode=pre_mode)
         return {"FINISHED"}
 
@@ -1620,6 +2231,25 @@ class CNV_OT_blur_shape_key(bpy.types.Operator):
         ("SMOOTH2", "スムーズ2", "", "SMOOTHCURVE", 3),
     ]
     blend = bpy.props.EnumProperty(items=items, name="減衰タイプ", default="LINER")
+    items = [
+        (
+            "DISTANCE",
+            "Distance",
+            "Blur with the vertices within the radius",
+            "PROP_ON",
+            1,
+        ),
+        (
+            "TOPOLOGY",
+            "Connected vertices",
+            "Blur with the vertices connected by an edge, never across separate parts",
+            "EDGESEL",
+            2,
+        ),
+    ]
+    neighborhood = bpy.props.EnumProperty(
+        items=items, name="Neighborhood", default="DISTANCE"
+    )
 
     @classmethod
     def poll(cls, context):
@@ -1634,18 +2264,18 @@ class CNV_OT_blur_shape_key(bpy.types.Operator):
 
     def draw(self, context):
         self.layout.prop(self, "target", icon="VIEWZOOM")
-        self.layout.prop(self, "radius", icon="RADIOBUT_OFF")
+        self.layout.prop(self, "neighborhood", icon="STICKY_UVS_LOC")
+        sub = self.layout.column()
+        sub.active = self.neighborhood == "DISTANCE"
+        sub.prop(self, "radius", icon="RADIOBUT_OFF")
         self.layout.prop(self, "strength", icon="ARROW_LEFTRIGHT")
         self.layout.prop(self, "effect", icon="BRUSH_BLUR")
-        self.layout.prop(self, "blend", icon="IPO_SINE")
-
-    def execute(self, context):
-        ob = context.active_object
-        me = ob.data
-
-        pre_mode = ob.mode
-        bpy.ops.object.mode_set(mode="OBJECT")
+        sub = self.layout.column()
+        sub.active = self.neighborhood == "DISTANCE"
+        sub.prop(self, "blend", icon="IPO_SINE")
 
+    def distance_neighborhood(self, context, me, base_co):
+        """Falloff weighted neighborhoods within the radius as a sparse matrix."""
         bm = bmesh.new()
         bm.from_mesh(me)
         edge_lengths = [e.calc_length() for e in bm.edges]
@@ -1659,81 +2289,50 @@ class CNV_OT_blur_shape_key(bpy.types.Operator):
 
         context.window_manager.progress_begin(0, len(me.vertices))
         progress_reduce = len(me.vertices) // 200 + 1
-        near_vert_data = []
-        kd = mathutils.kdtree.KDTree(len(me.vertices))
-        for vert in me.vertices:
-            kd.insert(vert.co.copy(), vert.index)
-        kd.balance()
-        for vert in me.vertices:
-            near_vert_data.append([])
-            near_vert_data_append = near_vert_data[-1].append
-            for co, index, dist in kd.find_range(vert.co, radius):
-                multi = (radius - dist) / radius
-                if self.blend == "SMOOTH1":
-                    multi = common.in_out_quad_blend(multi)
-                elif self.blend == "SMOOTH2":
-                    multi = common.bezier_blend(multi)
-                near_vert_data_append((index, multi))
-            if vert.index % progress_reduce == 0:
-                context.window_manager.progress_update(vert.index)
+
+        def progress_update(vert_index):
+            if vert_index % progress_reduce == 0:
+                context.window_manager.progress_update(vert_index)
+
+        indptr, indices, dists = meshutil.find_range_neighbors(
+            base_co, radius, progress_update
+        )
+        neighborhood = meshutil.Correspondence(
+            indptr,
+            indices,
+            meshutil.blend_curve((radius - dists) / radius, self.blend),
+            len(base_co),
+        )
         context.window_manager.progress_end()
+        return neighborhood
 
-        target_shape_keys = []
-        if self.target == "ACTIVE":
-            target_shape_keys.append(ob.active_shape_key)
-        elif self.target == "UP":
-            for index, shape_key in enumerate(me.shape_keys.key_blocks):
-                if index <= ob.active_shape_key_index:
-                    target_shape_keys.append(shape_key)
-        elif self.target == "DOWN":
-            for index, shape_key in enumerate(me.shape_keys.key_blocks):
-                if ob.active_shape_key_index <= index:
-                    target_shape_keys.append(shape_key)
-        elif self.target == "ALL":
-            for index, shape_key in enumerate(me.shape_keys.key_blocks):
-                target_shape_keys.append(shape_key)
-
-        progress_total = len(target_shape_keys) * self.strength * len(me.vertices)
-        context.window_manager.progress_begin(0, progress_total)
-        progress_reduce = progress_total // 200 + 1
-        progress_count = 0
-        for strength_count in range(self.strength):
-            for shape_key in target_shape_keys:
-                shapes = []
-                shapes_append = shapes.append
-                for index, vert in enumerate(me.vertices):
-                    co = shape_key.data[index].co - vert.co
-                    shapes_append(co)
-
-                for vert in me.vertices:
-                    target_shape = shapes[vert.index]
-
-                    total_shape = mathutils.Vector()
-                    total_multi = 0.0
-                    for index, multi in near_vert_data[vert.index]:
-                        co = shapes[index]
-                        if self.effect == "ADD":
-                            if target_shape.length <= co.length:
-                                total_shape += co * multi
-                                total_multi += multi
-                        elif self.effect == "SUB":
-                            if co.length <= target_shape.length:
-                                total_shape += co * multi
-                                total_multi += multi
-                        else:
-                            total_shape += co * multi
-                            total_multi += multi
-
-                    if 0 < total_multi:
-                        average_shape = total_shape / total_multi
-                    else:
-                        average_shape = mathutils.Vector()
+    def execute(self, context):
+        ob = context.active_object
+        me = ob.data
+
+        pre_mode = ob.mode
+        bpy.ops.object.mode_set(mode="OBJECT")
+
+        base_co = meshutil.read_co(me.vertices)
+        if self.neighborhood == "TOPOLOGY":
+            neighborhood = meshutil.edge_neighborhood(
+                meshutil.read_edges(me), len(base_co)
+            )
+        else:
+            neighborhood = self.distance_neighborhood(context, me, base_co)
 
-                    shape_key.data[vert.index].co = vert.co + average_shape
+        target_shape_keys = shape_key_range(ob, self.target)
 
-                    progress_count += 1
-                    if progress_count % progress_reduce == 0:
-                        context.window_manager.progress_update(progress_count)
+        progress_total = len(target_shape_keys)
+        context.window_manager.progress_begin(0, progress_total)
+        for progress_count, shape_key in enumerate(target_shape_keys):
+            deltas = meshutil.read_co(shape_key.data) - base_co
+            if not meshutil.moved_mask(deltas).any():
+                continue
+            for strength_count in range(self.strength):
+                deltas = meshutil.blur_deltas(deltas, neighborhood, self.effect)
+            meshutil.write_co(shape_key.data, base_co + deltas)
+            context.window_manager.progress_update(progress_count)
 
         context.window_manager.progress_end()
         bpy.ops.object.mode_set(mode=pre_mode)
@@ -1773,6 +2372,10 @@ class CNV_OT_change_base_shape_key(bpy.types.Operator):
 
         target_shape_key = ob.active_shape_key
         old_shape_key = me.shape_keys.key_blocks[0]
+        relative_key_names = {
+            shape_key.name: shape_key.relative_key.name
+            for shape_key in me.shape_keys.key_blocks
+        }
 
         # TOP指定でindex=1になるケースは、さらにもう一度UP
         bpy.ops.object.shape_key_move(type="TOP")
@@ -1782,27 +2385,37 @@ class CNV_OT_change_base_shape_key(bpy.types.Operator):
         target_shape_key.relative_key = target_shape_key
         old_shape_key.relative_key = target_shape_key
 
+        target_co = meshutil.read_co(target_shape_key.data)
         if self.is_deform_mesh:
-            for vert in me.vertices:
-                vert.co = target_shape_key.data[vert.index].co.copy()
+            meshutil.write_co(me.vertices, target_co)
 
         if self.is_deform_other_shape:
-            for shape_key in me.shape_keys.key_blocks:
-                if (
-                    shape_key.name == target_shape_key.name
-                    or shape_key.name == old_shape_key.name
-                ):
-                    continue
-                if shape_key.relative_key.name == old_shape_key.name:
-                    shape_key.relative_key = target_shape_key
-                    for vert in me.vertices:
-                        diff_co = (
-                            target_shape_key.data[vert.index].co
-                            - old_shape_key.data[vert.index].co
-                        )
-                        shape_key.data[vert.index].co = (
-                            shape_key.data[vert.index].co + diff_co
-                        )
+            # Keys relative to the old basis, directly or through other such
+            # keys, move along with it so their own deformation is kept
+            is_rebaseds = {target_shape_key.name: False, old_shape_key.name: True}
+
+            def is_rebased(name):
+                if name not in is_rebaseds:
+                    is_rebaseds[name] = False  # Guards against relative key cycles
+                    is_rebaseds[name] = is_rebased(relative_key_names[name])
+                return is_rebaseds[name]
+
+            rebased_keys = [
+                shape_key
+                for shape_key in me.shape_keys.key_blocks
+                if shape_key.name not in (target_shape_key.name, old_shape_key.name)
+                and is_rebased(shape_key.name)
+            ]
+            if rebased_keys:
+                diff_co = target_co - meshutil.read_co(old_shape_key.data)
+                cos = np.stack(
+                    [meshutil.read_co(shape_key.data) for shape_key in rebased_keys]
+                )
+                cos += diff_co
+                for shape_key, co in zip(rebased_keys, cos):
+                    if relative_key_names[shape_key.name] == old_shape_key.name:
+                        shape_key.relative_key = target_shape_key
+                    meshutil.write_co(shape_key.data, co)
 
         bpy.ops.object.mode_set(mode=pre_mode)
         return {"FINISHED"}
@@ -3,8 +3,11 @@ import time
 import bpy
 import bmesh
 import mathutils
+import numpy as np
 from . import common
 from . import compat
+from . import meshutil
+from . import weightutil
 from .translations.pgettext_functions import *
 
 
@@ -23,6 +26,22 @@ def menu_func(self, context):
     self.layout.operator("object.remove_noassign_vertex_groups", icon_value=icon_id)
 
 
+def vertex_group_range(ob, mode: str) -> list:
+    """Vertex groups of `ob` for an ACTIVE/UP/DOWN/ALL range around the active group.
+
+    UP and DOWN include the active group itself.
+    """
+    vertex_groups = ob.vertex_groups
+    active_index = vertex_groups.active_index
+    if mode == "ACTIVE":
+        return [vertex_groups.active]
+    elif mode == "UP":
+        return list(vertex_groups[: active_index + 1])
+    elif mode == "DOWN":
+        return list(vertex_groups[active_index:])
+    return list(vertex_groups)
+
+
 @compat.BlRegister()
 class CNV_OT_quick_transfer_vertex_group(bpy.types.Operator):
     bl_idname = "object.quick_transfer_vertex_group"
@@ -50,11 +69,19 @@ class CNV_OT_quick_transfer_vertex_group(bpy.types.Operator):
     vert_mapping = bpy.props.EnumProperty(
         items=items, name="参照要素", default="POLYINTERP_NEAREST"
     )
+    is_combined_index = bpy.props.BoolProperty(
+        name="Index Sources Together",
+        default=True,
+        description="With several sources, search all of them at once instead of joining copies of them (nearest vertex and nearest face only, sources without faces are still joined)",
+    )
     is_clean = bpy.props.BoolProperty(name="転送後にクリーンを実行", default=True)
     is_remove_noassign = bpy.props.BoolProperty(
         name="転送後に割り当てのない頂点グループを削除", default=True
     )
 
+    # Largest (target vertex, source vertex, group) product applied at once
+    chunk_entries = 4 * 1024 * 1024
+
     @classmethod
     def poll(cls, context):
         obs = context.selected_objects
@@ -81,13 +108,157 @@ class CNV_OT_quick_transfer_vertex_group(bpy.types.Operator):
         row.prop(self, "is_target_select_vert_only", icon="UV_SYNC_SELECT")
 
         self.layout.prop(self, "vert_mapping")
+        self.layout.prop(self, "is_combined_index", icon="OBJECT_DATA")
         self.layout.prop(self, "is_clean", icon="DISCLOSURE_TRI_DOWN")
         self.layout.prop(self, "is_remove_noassign", icon="X")
 
-    def execute(self, context):
-        class MyVertexGroupElement:
-            pass
+    def read_combined_source(self, source_obs):
+        """World space vertices, loop triangles and weights of all sources
+        stacked into one mesh, without making a copy of them.
+
+        Returns the union of the group names, in order of appearance, the
+        (N, 3) vertices, the (T, 3) triangles and the (N, G) weights of
+        those groups, or None when no source vertex is left.
+        """
+        group_names = []
+        for ob in source_obs:
+            for vg in ob.vertex_groups:
+                if vg.name not in group_names:
+                    group_names.append(vg.name)
+
+        cos_list = []
+        tris_list = []
+        weights_list = []
+        offset = 0
+        for ob in source_obs:
+            me = ob.data
+            if self.is_source_select_vert_only:
+                is_selecteds = np.zeros(len(me.vertices), dtype=bool)
+                me.vertices.foreach_get("select", is_selecteds)
+                kept_indices = np.flatnonzero(is_selecteds)
+            else:
+                kept_indices = np.arange(len(me.vertices))
+            remap = np.full(len(me.vertices), -1, dtype=np.int64)
+            remap[kept_indices] = np.arange(offset, offset + len(kept_indices))
+
+            cos = meshutil.transform_co(ob.matrix_world, meshutil.read_co(me.vertices))
+            cos_list.append(cos[kept_indices])
+            if self.vert_mapping == "POLYINTERP_NEAREST":
+                # Triangles losing a vertex are dropped, like deleting the
+                # unselected vertices does
+                tris = remap[meshutil.read_loop_triangles(me)]
+                tris_list.append(tris[np.all(0 <= tris, axis=1)])
+
+            group_indices = []
+            for name in group_names:
+                vg = ob.vertex_groups.get(name)
+                group_indices.append(vg.index if vg is not None else -1)
+            weights = weightutil.VertexWeights.from_object(ob).dense(group_indices)
+            weights_list.append(weights[kept_indices])
+            offset += len(kept_indices)
+
+        if not offset:
+            return None
+        if tris_list:
+            tris = np.concatenate(tris_list)
+        else:
+            tris = np.empty((0, 3), dtype=np.int64)
+        return (
+            group_names,
+            np.concatenate(cos_list),
+            tris,
+            np.concatenate(weights_list),
+        )
 
+    def transfer_combined(
+        self, target_ob, group_names, source_cos, source_tris, source_weights
+    ):
+        """Replace the weights of `group_names` on every target vertex, like
+        data_transfer does, from the output of read_combined_source().
+        Nearest face mapping needs `source_tris` to have triangles.
+        """
+        target_me = target_ob.data
+        target_cos = meshutil.transform_co(
+            target_ob.matrix_world, meshutil.read_co(target_me.vertices)
+        )
+
+        if self.vert_mapping == "POLYINTERP_NEAREST":
+            indptr, indices, dists, mini_dists, barys = meshutil.find_near_surface(
+                source_cos, source_tris, target_cos
+            )
+            correspondence = meshutil.Correspondence(
+                indptr, indices, barys, len(source_cos)
+            )
+        else:
+            kd = mathutils.kdtree.KDTree(len(source_cos))
+            for index, co in enumerate(source_cos.tolist()):
+                kd.insert(co, index)
+            kd.balance()
+            correspondence = meshutil.Correspondence.from_nearest(
+                [kd.find(co)[1] for co in target_cos.tolist()], len(source_cos)
+            )
+
+        target_weights = np.empty(
+            (len(target_cos), len(group_names)), dtype=source_weights.dtype
+        )
+        average_fan_in = max(1, round(correspondence.fan_in()[0]))
+        chunk_size = max(
+            1, self.chunk_entries // (average_fan_in * max(1, len(group_names)))
+        )
+        for start in range(0, len(target_weights), chunk_size):
+            stop = min(start + chunk_size, len(target_weights))
+            target_weights[start:stop] = correspondence.apply(
+                source_weights, start, stop
+            )
+
+        for column, name in enumerate(group_names):
+            vg = target_ob.vertex_groups.get(name)
+            if vg is None:
+                vg = target_ob.vertex_groups.new(name=name)
+            weightutil.write_group(vg, target_weights[:, column])
+
+    def restore_weights(self, target_ob, old_weights, old_group_names):
+        """Put back the weights from before the transfer in locked groups, and
+        in every group for the unselected vertices when only selected ones
+        were targeted.
+        """
+        target_me = target_ob.data
+        if self.is_target_select_vert_only:
+            is_restoreds = np.zeros(len(target_me.vertices), dtype=bool)
+            target_me.vertices.foreach_get("select", is_restoreds)
+            np.logical_not(is_restoreds, out=is_restoreds)
+        else:
+            is_restoreds = None
+
+        group_indices = []
+        old_group_indices = []
+        for vg in target_ob.vertex_groups:
+            if not vg.lock_weight and is_restoreds is None:
+                continue
+            group_indices.append(vg.index)
+            old_group_indices.append(
+                old_group_names.index(vg.name) if vg.name in old_group_names else -1
+            )
+        if not group_indices:
+            return
+
+        new_weights = weightutil.VertexWeights.from_object(target_ob)
+        weights = new_weights.dense(group_indices)
+        is_assigneds = new_weights.assigned(group_indices)
+        restore_weights = old_weights.dense(old_group_indices)
+        restore_is_assigneds = old_weights.assigned(old_group_indices)
+        for column, vg_index in enumerate(group_indices):
+            if target_ob.vertex_groups[vg_index].lock_weight:
+                rows = slice(None)
+            else:
+                rows = is_restoreds
+            weights[rows, column] = restore_weights[rows, column]
+            is_assigneds[rows, column] = restore_is_assigneds[rows, column]
+        new_weights.write_changes(
+            target_ob.vertex_groups, group_indices, weights, is_assigneds
+        )
+
+    def execute(self, context):
         target_ob = context.active_object
         target_me = target_ob.data
 
@@ -99,93 +270,115 @@ class CNV_OT_quick_transfer_vertex_group(bpy.types.Operator):
             if ob.name != target_ob.name:
                 original_source_obs.append(ob)
 
-        compat.set_select(target_ob, False)
-        compat.set_active(context, original_source_obs[0])
-        bpy.ops.object.duplicate(linked=False, mode="TRANSLATION")
-        if len(context.selected_objects) > 1:
-            bpy.ops.object.join()
-        join_source_ob = context.selected_objects[0]
-        join_source_me = join_source_ob.data
-
-        temp_source_ob = join_source_ob.copy()
-        temp_source_me = join_source_me.copy()
-        temp_source_ob.data = temp_source_me
-        compat.link(context.scene, temp_source_ob)
-        compat.set_select(temp_source_ob, True)
-        compat.set_select(join_source_ob, False)
-        compat.set_active(context, temp_source_ob)
-        if self.is_source_select_vert_only:
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_all(action="INVERT")
-            bpy.ops.mesh.delete(type="VERT")
-            bpy.ops.object.mode_set(mode="OBJECT")
-
-        compat.set_select(target_ob, True)
-        compat.set_active(context, target_ob)
+        # Several sources can be indexed together for the nearest vertex and
+        # face mappings, without joining copies of them
+        is_combined = (
+            self.is_combined_index
+            and 1 < len(original_source_obs)
+            and self.vert_mapping in ("NEAREST", "POLYINTERP_NEAREST")
+        )
+        if is_combined:
+            combined_source = self.read_combined_source(original_source_obs)
+            if combined_source is None:
+                self.report(
+                    type={"ERROR"}, message="頂点がひとつも存在しません、中止します"
+                )
+                return {"CANCELLED"}
+            # Without faces the joined copy falls back to the nearest edges,
+            # which has no counterpart here
+            if self.vert_mapping == "POLYINTERP_NEAREST" and not len(
+                combined_source[2]
+            ):
+                is_combined = False
+        if not is_combined:
+            compat.set_select(target_ob, False)
+            compat.set_active(context, original_source_obs[0])
+            bpy.ops.object.duplicate(linked=False, mode="TRANSLATION")
+            if len(context.selected_objects) > 1:
+                bpy.ops.object.join()
+            join_source_ob = context.selected_objects[0]
+            join_source_me = join_source_ob.data
+
+            temp_source_ob = join_source_ob.copy()
+            temp_source_me = join_source_me.copy()
+            temp_source_ob.data = temp_source_me
+            compat.link(context.scene, temp_source_ob)
+            compat.set_select(temp_source_ob, True)
+            compat.set_select(join_source_ob, False)
+            compat.set_active(context, temp_source_ob)
+            if self.is_source_select_vert_only:
+                bpy.ops.object.mode_set(mode="EDIT")
+                bpy.ops.mesh.select_all(action="INVERT")
+                bpy.ops.mesh.delete(type="VERT")
+                bpy.ops.object.mode_set(mode="OBJECT")
 
-        if (
-            self.vert_mapping == "POLYINTERP_VNORPROJ"
-            and len(temp_source_me.polygons) == 0
-        ):
-            self.vert_mapping = "EDGEINTERP_NEAREST"
-            self.report(
-                type={"WARNING"},
-                message="面がひとつも存在しません、辺モードに変更します",
-            )
-        if (
-            self.vert_mapping == "POLYINTERP_NEAREST"
-            and len(temp_source_me.polygons) == 0
-        ):
-            self.vert_mapping = "EDGEINTERP_NEAREST"
-            self.report(
-                type={"WARNING"},
-                message="面がひとつも存在しません、辺モードに変更します",
-            )
-        if self.vert_mapping == "EDGEINTERP_NEAREST" and len(temp_source_me.edges) == 0:
-            self.vert_mapping = "NEAREST"
-            self.report(
-                type={"WARNING"},
-                message="辺がひとつも存在しません、頂点モードに変更します",
-            )
-        if self.vert_mapping == "NEAREST" and len(temp_source_me.vertices) == 0:
-            self.report(
-                type={"ERROR"}, message="頂点がひとつも存在しません、中止します"
-            )
-            return {"CANCELLED"}
+            compat.set_select(target_ob, True)
+            compat.set_active(context, target_ob)
+
+            if (
+                self.vert_mapping == "POLYINTERP_VNORPROJ"
+                and len(temp_source_me.polygons) == 0
+            ):
+                self.vert_mapping = "EDGEINTERP_NEAREST"
+                self.report(
+                    type={"WARNING"},
+                    message="面がひとつも存在しません、辺モードに変更します",
+                )
+            if (
+                self.vert_mapping == "POLYINTERP_NEAREST"
+                and len(temp_source_me.polygons) == 0
+            ):
+                self.vert_mapping = "EDGEINTERP_NEAREST"
+                self.report(
+                    type={"WARNING"},
+                    message="面がひとつも存在しません、辺モードに変更します",
+                )
+            if (
+                self.vert_mapping == "EDGEINTERP_NEAREST"
+                and len(temp_source_me.edges) == 0
+            ):
+                self.vert_mapping = "NEAREST"
+                self.report(
+                    type={"WARNING"},
+                    message="辺がひとつも存在しません、頂点モードに変更します",
+                )
+            if self.vert_mapping == "NEAREST" and len(temp_source_me.vertices) == 0:
+                self.report(
+                    type={"ERROR"}, message="頂点がひとつも存在しません、中止します"
+                )
+                return {"CANCELLED"}
 
         if self.is_remove_old_vertex_groups:
             for vg in target_ob.vertex_groups[:]:
                 if not vg.lock_weight:
                     target_ob.vertex_groups.remove(vg)
 
-        old_vertex_groups = []
-        for vert in target_me.vertices:
-            mvges = []
-            for vge in vert.groups:
-                mvge = MyVertexGroupElement()
-                mvge.vertex_group = target_ob.vertex_groups[vge.group]
-                mvge.weight = vge.weight
-                mvges.append(mvge)
-            old_vertex_groups.append(mvges)
+        # Weights to restore after the transfer, by group name since the
+        # transfer adds groups
+        old_weights = weightutil.VertexWeights.from_object(target_ob)
+        old_group_names = [vg.name for vg in target_ob.vertex_groups]
 
         if self.is_remove_noassign:
             pre_vertex_group_names = [vg.name for vg in target_ob.vertex_groups]
 
-        bpy.ops.object.data_transfer(
-            use_reverse_transfer=True,
-            use_freeze=False,
-            data_type="VGROUP_WEIGHTS",
-            use_create=True,
-            vert_mapping=self.vert_mapping,
-            use_auto_transform=False,
-            use_object_transform=True,
-            use_max_distance=False,
-            ray_radius=0,
-            layers_select_src="NAME",
-            layers_select_dst="ALL",
-            mix_mode="REPLACE",
-            mix_factor=1,
-        )
+        if is_combined:
+            self.transfer_combined(target_ob, *combined_source)
+        else:
+            bpy.ops.object.data_transfer(
+                use_reverse_transfer=True,
+                use_freeze=False,
+                data_type="VGROUP_WEIGHTS",
+                use_create=True,
+                vert_mapping=self.vert_mapping,
+                use_auto_transform=False,
+                use_object_transform=True,
+                use_max_distance=False,
+                ray_radius=0,
+                layers_select_src="NAME",
+                layers_select_dst="ALL",
+                mix_mode="REPLACE",
+                mix_factor=1,
+            )
         if self.is_clean:
             bpy.ops.object.vertex_group_clean(
                 group_select_mode="ALL", limit=0.00000000001
@@ -195,38 +388,22 @@ class CNV_OT_quick_transfer_vertex_group(bpy.types.Operator):
         bpy.ops.object.mode_set(mode="OBJECT")
 
         if self.is_remove_noassign:
-            is_keeps = [False for i in range(len(target_ob.vertex_groups))]
-            for vert in target_me.vertices:
-                for vge in vert.groups:
-                    if not is_keeps[vge.group]:
-                        if 0.000001 < vge.weight:
-                            is_keeps[vge.group] = True
+            is_keeps = (
+                0.000001 < weightutil.VertexWeights.from_object(target_ob).group_max()
+            )
             copy_vertex_groups = target_ob.vertex_groups[:]
             for i in range(len(copy_vertex_groups)):
                 if not is_keeps[i] and not copy_vertex_groups[i].lock_weight:
                     if copy_vertex_groups[i].name not in pre_vertex_group_names:
                         target_ob.vertex_groups.remove(copy_vertex_groups[i])
 
-        if self.is_target_select_vert_only:
-            for vert in target_me.vertices:
-                if not vert.select:
-                    for vg in target_ob.vertex_groups:
-                        vg.remove([vert.index])
-                    for mvge in old_vertex_groups[vert.index]:
-                        mvge.vertex_group.add([vert.index], mvge.weight, "REPLACE")
-
-        for vert in target_me.vertices:
-            for vg in target_ob.vertex_groups:
-                if vg.lock_weight:
-                    vg.remove([vert.index])
-            for mvge in old_vertex_groups[vert.index]:
-                if mvge.vertex_group.lock_weight:
-                    mvge.vertex_group.add([vert.index], mvge.weight, "REPLACE")
-
-        common.remove_data([temp_source_ob, temp_source_me])
-        compat.set_select(join_source_ob, True)
-
-        common.remove_data([join_source_ob, join_source_me])
+        self.restore_weights(target_ob, old_weights, old_group_names)
+
+        if not is_combined:
+            common.remove_data([temp_source_ob, temp_source_me])
+            compat.set_select(join_source_ob, True)
+
+            common.remove_data([join_source_ob, join_source_me])
         for ob in original_source_obs:
             compat.set_select(ob, True)
 
@@ -245,6 +422,16 @@ class CNV_OT_precision_transfer_vertex_group(bpy.types.Operator):
     is_first_remove_all = bpy.props.BoolProperty(
         name="すでにある頂点グループを削除 (ロックで保護)", default=False
     )
+    items = [
+        ("SUBDIVIDE", "Subdivide source", "", "LATTICE_DATA", 1),
+        ("SURFACE", "Closest surface point", "", "SNAP_FACE", 2),
+    ]
+    bind_method = bpy.props.EnumProperty(
+        items=items,
+        name="Bind method",
+        default="SUBDIVIDE",
+        description="Subdivide a copy of the source, or interpolate the source faces at the closest point",
+    )
     subdivide_number = bpy.props.IntProperty(
         name="参照元の分割", default=1, min=0, max=10, soft_min=0, soft_max=10
     )
@@ -262,6 +449,9 @@ class CNV_OT_precision_transfer_vertex_group(bpy.types.Operator):
         name="割り当てのない頂点グループを削除", default=True
     )
 
+    # Correspondence entries * groups weighted at once, bounds the temporaries
+    chunk_entries = 4 * 1024 * 1024
+
     @classmethod
     def poll(cls, context):
         active_ob = context.active_object
@@ -282,7 +472,10 @@ class CNV_OT_precision_transfer_vertex_group(bpy.types.Operator):
 
     def draw(self, context):
         self.layout.prop(self, "is_first_remove_all", icon="ERROR")
-        self.layout.prop(self, "subdivide_number", icon="LATTICE_DATA")
+        self.layout.prop(self, "bind_method", icon="SNAP_ON")
+        sub = self.layout.row()
+        sub.active = self.bind_method == "SUBDIVIDE"
+        sub.prop(self, "subdivide_number", icon="LATTICE_DATA")
         self.layout.prop(self, "extend_range", icon="PROP_ON")
         self.layout.prop(self, "is_remove_empty", icon="X")
 
@@ -299,123 +492,172 @@ class CNV_OT_precision_transfer_vertex_group(bpy.types.Operator):
             if ob.name != target_ob.name:
                 source_original_ob = ob
                 break
-        source_ob = source_original_ob.copy()
-        source_me = source_original_ob.data.copy()
-        source_ob.data = source_me
-        compat.link(context.scene, source_ob)
-
-        compat.set_select(target_ob, False)
-        compat.set_select(source_original_ob, False)
-        compat.set_active(context, source_ob)
+
+        # The surface bind reads the source as is, only subdividing needs a copy
+        is_copy_source = self.bind_method == "SUBDIVIDE"
+        if is_copy_source:
+            source_ob = source_original_ob.copy()
+            source_me = source_original_ob.data.copy()
+            source_ob.data = source_me
+            compat.link(context.scene, source_ob)
+
+            compat.set_select(target_ob, False)
+            compat.set_select(source_original_ob, False)
+            compat.set_active(context, source_ob)
+        else:
+            source_ob = source_original_ob
+            source_me = source_original_ob.data
         try:
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.reveal()
-            bpy.ops.mesh.select_all(action="SELECT")
-            bpy.ops.mesh.subdivide(
-                number_cuts=self.subdivide_number,
-                smoothness=0.0,
-                quadcorner="STRAIGHT_CUT",
-                fractal=0.0,
-                fractal_along_normal=0.0,
-                seed=0,
-            )
-            bpy.ops.object.mode_set(mode="OBJECT")
+            if is_copy_source:
+                bpy.ops.object.mode_set(mode="EDIT")
+                bpy.ops.mesh.reveal()
+                bpy.ops.mesh.select_all(action="SELECT")
+                bpy.ops.mesh.subdivide(
+                    number_cuts=self.subdivide_number,
+                    smoothness=0.0,
+                    quadcorner="STRAIGHT_CUT",
+                    fractal=0.0,
+                    fractal_along_normal=0.0,
+                    seed=0,
+                )
+                bpy.ops.object.mode_set(mode="OBJECT")
 
             if self.is_first_remove_all:
                 for vg in target_ob.vertex_groups[:]:
                     if not vg.lock_weight:
                         target_ob.vertex_groups.remove(vg)
 
-            kd = mathutils.kdtree.KDTree(len(source_me.vertices))
-            for vert in source_me.vertices:
-                co = compat.mul(source_ob.matrix_world, vert.co)
-                kd.insert(co, vert.index)
-            kd.balance()
+            source_tris = None
+            if not is_copy_source:
+                source_tris = meshutil.read_loop_triangles(source_me)
+                if not len(source_tris):
+                    self.report(
+                        type={"WARNING"},
+                        message="The source has no faces, binding to its vertices instead",
+                    )
+                    source_tris = None
 
             context.window_manager.progress_begin(0, len(target_me.vertices))
             progress_reduce = len(target_me.vertices) // 200 + 1
-            near_vert_data = []
-            near_vert_multi_total = []
-            near_vert_multi_total_append = near_vert_multi_total.append
-            for vert in target_me.vertices:
-                near_vert_data.append([])
-                near_vert_data_append = near_vert_data[-1].append
-
-                target_co = compat.mul(target_ob.matrix_world, vert.co)
-
-                mini_co, mini_index, mini_dist = kd.find(target_co)
-                radius = mini_dist * self.extend_range
-                diff_radius = radius - mini_dist
-
-                multi_total = 0.0
-                for co, index, dist in kd.find_range(target_co, radius):
-                    if 0 < diff_radius:
-                        multi = (diff_radius - (dist - mini_dist)) / diff_radius
-                    else:
-                        multi = 1.0
-                    near_vert_data_append((index, multi))
-                    multi_total += multi
-                near_vert_multi_total_append(multi_total)
-
-                if vert.index % progress_reduce == 0:
-                    context.window_manager.progress_update(vert.index)
+            if source_tris is not None:
+
+                def progress_update(vert_index):
+                    if vert_index % progress_reduce == 0:
+                        context.window_manager.progress_update(vert_index)
+
+                indptr, indices, dists, mini_dists, barys = meshutil.find_near_surface(
+                    meshutil.transform_co(
+                        source_ob.matrix_world, meshutil.read_co(source_me.vertices)
+                    ),
+                    source_tris,
+                    meshutil.transform_co(
+                        target_ob.matrix_world, meshutil.read_co(target_me.vertices)
+                    ),
+                    self.extend_range,
+                    progress_update,
+                )
+                multis = (
+                    meshutil.falloff_weights(
+                        indptr, dists, mini_dists, self.extend_range
+                    )
+                    * barys
+                )
+            else:
+                kd = mathutils.kdtree.KDTree(len(source_me.vertices))
+                for vert in source_me.vertices:
+                    co = compat.mul(source_ob.matrix_world, vert.co)
+                    kd.insert(co, vert.index)
+                kd.balance()
+
+                row_counts = []
+                indices = []
+                multis = []
+                for vert in target_me.vertices:
+                    target_co = compat.mul(target_ob.matrix_world, vert.co)
+
+                    mini_co, mini_index, mini_dist = kd.find(target_co)
+                    radius = mini_dist * self.extend_range
+                    diff_radius = radius - mini_dist
+
+                    hits = kd.find_range(target_co, radius)
+                    for co, index, dist in hits:
+                        if 0 < diff_radius:
+                            multi = (diff_radius - (dist - mini_dist)) / diff_radius
+                        else:
+                            multi = 1.0
+                        indices.append(index)
+                        multis.append(multi)
+                    row_counts.append(len(hits))
+
+                    if vert.index % progress_reduce == 0:
+                        context.window_manager.progress_update(vert.index)
+                indptr = np.concatenate(([0], np.cumsum(row_counts, dtype=np.int64)))
+            correspondence = meshutil.Correspondence(
+                indptr, indices, multis, len(source_me.vertices)
+            )
             context.window_manager.progress_end()
 
-            context.window_manager.progress_begin(0, len(source_ob.vertex_groups))
-            for source_vertex_group in source_ob.vertex_groups:
-                if source_vertex_group.name in target_ob.vertex_groups:
-                    target_vertex_group = target_ob.vertex_groups[
-                        source_vertex_group.name
-                    ]
-                else:
+            # Every group at once, (N_src, G) source weights through the
+            # correspondence give the (N_tgt, G) target weights
+            source_vertex_groups = list(source_ob.vertex_groups)
+            source_weights = weightutil.VertexWeights.from_object(source_ob).dense(
+                [vg.index for vg in source_vertex_groups]
+            )
+            target_weights = np.empty(
+                (len(target_me.vertices), len(source_vertex_groups)),
+                dtype=source_weights.dtype,
+            )
+            average_fan_in = max(1, round(correspondence.fan_in()[0]))
+            chunk_size = max(
+                1,
+                self.chunk_entries
+                // (average_fan_in * max(1, len(source_vertex_groups))),
+            )
+            for start in range(0, len(target_weights), chunk_size):
+                stop = min(start + chunk_size, len(target_weights))
+                target_weights[start:stop] = correspondence.apply(
+                    source_weights, start, stop
+                )
+            is_weighteds = 0.000001 < target_weights
+
+            context.window_manager.progress_begin(0, len(source_vertex_groups))
+            for column, source_vertex_group in enumerate(source_vertex_groups):
+                context.window_manager.progress_update(column)
+                target_vertex_group = target_ob.vertex_groups.get(
+                    source_vertex_group.name
+                )
+                weighted_indices = np.flatnonzero(is_weighteds[:, column])
+                if not len(weighted_indices):
+                    # Nothing to write, only clear an existing group
+                    if target_vertex_group is None:
+                        if not self.is_remove_empty:
+                            target_ob.vertex_groups.new(name=source_vertex_group.name)
+                    elif self.is_remove_empty:
+                        target_ob.vertex_groups.remove(target_vertex_group)
+                    elif not self.is_first_remove_all:
+                        target_vertex_group.remove(list(range(len(target_me.vertices))))
+                    continue
+
+                if target_vertex_group is None:
                     target_vertex_group = target_ob.vertex_groups.new(
                         name=source_vertex_group.name
                     )
-
-                is_waighted = False
-
-                source_weights = []
-                source_weights_append = source_weights.append
-                for source_vert in source_me.vertices:
-                    for elem in source_vert.groups:
-                        if elem.group == source_vertex_group.index:
-                            source_weights_append(elem.weight)
-                            break
-                    else:
-                        source_weights_append(0.0)
-
-                for target_vert in target_me.vertices:
-                    if 0 < near_vert_multi_total[target_vert.index]:
-                        total_weight = [
-                            source_weights[i] * m
-                            for i, m in near_vert_data[target_vert.index]
-                        ]
-                        total_weight = sum(total_weight)
-
-                        average_weight = (
-                            total_weight / near_vert_multi_total[target_vert.index]
-                        )
-                    else:
-                        average_weight = 0.0
-
-                    if 0.000001 < average_weight:
-                        target_vertex_group.add(
-                            [target_vert.index], average_weight, "REPLACE"
-                        )
-                        is_waighted = True
-                    else:
-                        if not self.is_first_remove_all:
-                            target_vertex_group.remove([target_vert.index])
-
-                context.window_manager.progress_update(source_vertex_group.index)
-
-                if not is_waighted and self.is_remove_empty:
-                    target_ob.vertex_groups.remove(target_vertex_group)
+                weightutil.write_group(
+                    target_vertex_group,
+                    target_weights[weighted_indices, column],
+                    weighted_indices,
+                    (
+                        None
+                        if self.is_first_remove_all
+                        else np.flatnonzero(~is_weighteds[:, column])
+                    ),
+                )
             context.window_manager.progress_end()
 
             target_ob.vertex_groups.active_index = 0
         finally:
-            common.remove_data([source_ob, source_me])
+            if is_copy_source:
+                common.remove_data([source_ob, source_me])
             compat.set_select(source_original_ob, True)
             compat.set_select(target_ob, True)
             compat.set_active(context, target_ob)
@@ -537,6 +779,25 @@ class CNV_OT_blur_vertex_group(bpy.types.Operator):
     ]
     effect = bpy.props.EnumProperty(items=items, name="ぼかし効果", default="BOTH")
     is_normalize = bpy.props.BoolProperty(name="他頂点グループも調節", default=True)
+    items = [
+        (
+            "DISTANCE",
+            "Distance",
+            "Blur with the vertices within the radius",
+            "PROP_ON",
+            1,
+        ),
+        (
+            "TOPOLOGY",
+            "Connected vertices",
+            "Blur with the vertices connected by an edge, never across separate parts",
+            "EDGESEL",
+            2,
+        ),
+    ]
+    neighborhood = bpy.props.EnumProperty(
+        items=items, name="Neighborhood", default="DISTANCE"
+    )
 
     @classmethod
     def poll(cls, context):
@@ -550,18 +811,16 @@ class CNV_OT_blur_vertex_group(bpy.types.Operator):
 
     def draw(self, context):
         self.layout.prop(self, "target", icon="VIEWZOOM")
-        self.layout.prop(self, "radius", icon="PROP_ON")
+        self.layout.prop(self, "neighborhood", icon="STICKY_UVS_LOC")
+        sub = self.layout.column()
+        sub.active = self.neighborhood == "DISTANCE"
+        sub.prop(self, "radius", icon="PROP_ON")
         self.layout.prop(self, "strength", icon="ARROW_LEFTRIGHT")
         self.layout.prop(self, "effect", icon="BRUSH_BLUR")
         self.layout.prop(self, "is_normalize", icon="GROUP")
 
-    def execute(self, context):
-        ob = context.active_object
-        me = ob.data
-
-        pre_mode = ob.mode
-        bpy.ops.object.mode_set(mode="OBJECT")
-
+    def distance_neighborhood(self, context, me):
+        """Falloff weighted neighborhoods within the radius as a sparse matrix."""
         bm = bmesh.new()
         bm.from_mesh(me)
         edge_lengths = [e.calc_length() for e in bm.edges]
@@ -574,108 +833,66 @@ class CNV_OT_blur_vertex_group(bpy.types.Operator):
 
         context.window_manager.progress_begin(0, len(me.vertices))
         progress_reduce = len(me.vertices) // 200 + 1
-        near_vert_data = []
-        kd = mathutils.kdtree.KDTree(len(me.vertices))
-        for vert in me.vertices:
-            kd.insert(vert.co.copy(), vert.index)
-        kd.balance()
-        for vert in me.vertices:
-            new_vert_datum = []
-            near_vert_data.append(new_vert_datum)
-            near_vert_data_append = new_vert_datum.append
-            for co, index, dist in kd.find_range(vert.co, radius):
-                multi = (radius - dist) / radius
-                near_vert_data_append((index, multi))
-            if vert.index % progress_reduce == 0:
-                context.window_manager.progress_update(vert.index)
+
+        def progress_update(vert_index):
+            if vert_index % progress_reduce == 0:
+                context.window_manager.progress_update(vert_index)
+
+        indptr, indices, dists = meshutil.find_range_neighbors(
+            meshutil.read_co(me.vertices), radius, progress_update
+        )
         context.window_manager.progress_end()
+        return meshutil.Correspondence(
+            indptr, indices, (radius - dists) / radius, len(me.vertices)
+        )
 
-        target_vertex_groups = []
-        if self.target == "ACTIVE":
-            target_vertex_groups.append(ob.vertex_groups.active)
-        elif self.target == "UP":
-            for vertex_group in ob.vertex_groups:
-                if vertex_group.index <= ob.vertex_groups.active_index:
-                    target_vertex_groups.append(vertex_group)
-        elif self.target == "DOWN":
-            for vertex_group in ob.vertex_groups:
-                if ob.vertex_groups.active_index <= vertex_group.index:
-                    target_vertex_groups.append(vertex_group)
-        elif self.target == "ALL":
-            for vertex_group in ob.vertex_groups:
-                target_vertex_groups.append(vertex_group)
-
-        progress_total = len(target_vertex_groups) * self.strength * len(me.vertices)
+    def execute(self, context):
+        ob = context.active_object
+        me = ob.data
+
+        pre_mode = ob.mode
+        bpy.ops.object.mode_set(mode="OBJECT")
+
+        if self.neighborhood == "TOPOLOGY":
+            neighborhood = meshutil.edge_neighborhood(
+                meshutil.read_edges(me), len(me.vertices)
+            )
+        else:
+            neighborhood = self.distance_neighborhood(context, me)
+
+        target_vertex_groups = vertex_group_range(ob, self.target)
+
+        vertex_weights = weightutil.VertexWeights.from_object(ob)
+        group_indices = list(range(len(ob.vertex_groups)))
+        weights = vertex_weights.dense(group_indices)
+        is_assigneds = vertex_weights.assigned(group_indices)
+
+        progress_total = len(target_vertex_groups) * self.strength
         context.window_manager.progress_begin(0, progress_total)
-        progress_reduce = progress_total // 200 + 1
         progress_count = 0
         for strength_count in range(self.strength):
             for vertex_group in target_vertex_groups:
-                weights = []
-                weights_append = weights.append
-                for vert in me.vertices:
-                    for elem in vert.groups:
-                        if elem.group == vertex_group.index:
-                            weights_append(elem.weight)
-                            break
-                    else:
-                        weights_append(0.0)
-
-                for vert in me.vertices:
-                    target_weight = weights[vert.index]
-
-                    total_weight = 0.0
-                    total_multi = 0.0
-                    for index, multi in near_vert_data[vert.index]:
-                        if self.effect == "ADD":
-                            if target_weight <= weights[index]:
-                                total_weight += weights[index] * multi
-                                total_multi += multi
-                        elif self.effect == "SUB":
-                            if weights[index] <= target_weight:
-                                total_weight += weights[index] * multi
-                                total_multi += multi
-                        else:
-                            total_weight += weights[index] * multi
-                            total_multi += multi
-
-                    if 0 < total_multi:
-                        average_weight = total_weight / total_multi
-                    else:
-                        average_weight = 0.0
-
-                    if 0.001 < average_weight:
-                        vertex_group.add([vert.index], average_weight, "REPLACE")
-                    else:
-                        vertex_group.remove([vert.index])
-
-                    progress_count += 1
-                    if progress_count % progress_reduce == 0:
-                        context.window_manager.progress_update(progress_count)
-
-                    if self.is_normalize:
-                        other_weight_total = 0.0
-                        for elem in vert.groups:
-                            if elem.group != vertex_group.index:
-                                other_weight_total += elem.weight
-
-                        diff_weight = average_weight - target_weight
-                        new_other_weight_total = other_weight_total - diff_weight
-                        if 0 < other_weight_total:
-                            other_weight_multi = (
-                                new_other_weight_total / other_weight_total
-                            )
-                        else:
-                            other_weight_multi = 0.0
+                column = vertex_group.index
+                old_weights = weights[:, column].copy()
+                average_weights = meshutil.blur_deltas(
+                    weights[:, column : column + 1], neighborhood, self.effect
+                )[:, 0]
+
+                is_keeps = 0.001 < average_weights
+                weights[:, column] = np.where(is_keeps, average_weights, 0.0)
+                is_assigneds[:, column] = is_keeps
+
+                if self.is_normalize:
+                    weightutil.rescale_others(
+                        weights, column, average_weights - old_weights
+                    )
+
+                progress_count += 1
+                context.window_manager.progress_update(progress_count)
 
-                        for elem in vert.groups:
-                            if elem.group != vertex_group.index:
-                                vg = ob.vertex_groups[elem.group]
-                                vg.add(
-                                    [vert.index],
-                                    elem.weight * other_weight_multi,
-                                    "REPLACE",
-                                )
+        vertex_weights.write_changes(
+            ob.vertex_groups, group_indices, weights, is_assigneds
+        )
 
         context.window_manager.progress_end()
         bpy.ops.object.mode_set(mode=pre_mode)
@@ -733,53 +950,28 @@ class CNV_OT_multiply_vertex_group(bpy.types.Operator):
         pre_mode = ob.mode
         bpy.ops.object.mode_set(mode="OBJECT")
 
-        target_vertex_groups = []
-        if self.target == "ACTIVE":
-            target_vertex_groups.append(ob.vertex_groups.active)
-        elif self.target == "UP":
-            for vertex_group in ob.vertex_groups:
-                if vertex_group.index <= ob.vertex_groups.active_index:
-                    target_vertex_groups.append(vertex_group)
-        elif self.target == "DOWN":
-            for vertex_group in ob.vertex_groups:
-                if ob.vertex_groups.active_index <= vertex_group.index:
-                    target_vertex_groups.append(vertex_group)
-        elif self.target == "ALL":
-            for vertex_group in ob.vertex_groups:
-                target_vertex_groups.append(vertex_group)
-
-        for vertex_group in target_vertex_groups:
-            for vert in me.vertices:
-                old_weight = -1
-                other_weight_total = 0.0
-                for elem in vert.groups:
-                    if elem.group == vertex_group.index:
-                        old_weight = elem.weight
-                    else:
-                        other_weight_total += elem.weight
-                if old_weight == -1:
-                    continue
+        target_vertex_groups = vertex_group_range(ob, self.target)
 
-                new_weight = old_weight * self.value
-                vertex_group.add([vert.index], new_weight, "REPLACE")
+        vertex_weights = weightutil.VertexWeights.from_object(ob)
+        group_indices = list(range(len(ob.vertex_groups)))
+        weights = vertex_weights.dense(group_indices)
+        is_assigneds = vertex_weights.assigned(group_indices)
 
-                if self.is_normalize:
-                    diff_weight = new_weight - old_weight
-
-                    new_other_weight_total = other_weight_total - diff_weight
-                    if 0 < other_weight_total:
-                        other_weight_multi = new_other_weight_total / other_weight_total
-                    else:
-                        other_weight_multi = 0.0
-
-                    for elem in vert.groups:
-                        if elem.group != vertex_group.index:
-                            vg = ob.vertex_groups[elem.group]
-                            vg.add(
-                                [vert.index],
-                                elem.weight * other_weight_multi,
-                                "REPLACE",
-                            )
+        for vertex_group in target_vertex_groups:
+            column = vertex_group.index
+            rows = is_assigneds[:, column]
+            old_weights = weights[:, column].copy()
+            new_weights = old_weights * self.value
+            weights[rows, column] = np.clip(new_weights[rows], 0.0, 1.0)
+
+            if self.is_normalize:
+                weightutil.rescale_others(
+                    weights, column, new_weights - old_weights, rows
+                )
+
+        vertex_weights.write_changes(
+            ob.vertex_groups, group_indices, weights, is_assigneds
+        )
 
         bpy.ops.object.mode_set(mode=pre_mode)
         return {"FINISHED"}
@@ -818,15 +1010,8 @@ class CNV_OT_remove_noassign_vertex_groups(bpy.types.Operator):
 
     def execute(self, context):
         ob = context.active_object
-        me = ob.data
-
-        is_keeps = [False for i in range(len(ob.vertex_groups))]
 
-        for vert in me.vertices:
-            for vge in vert.groups:
-                if not is_keeps[vge.group]:
-                    if self.threshold < vge.weight:
-                        is_keeps[vge.group] = True
+        is_keeps = self.threshold < weightutil.VertexWeights.from_object(ob).group_max()
 
         copy_vertex_groups = ob.vertex_groups[:]
         for i in range(len(copy_vertex_groups)):
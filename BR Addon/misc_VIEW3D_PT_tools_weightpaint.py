@@ -2,8 +2,11 @@
 import bpy
 import bmesh
 import mathutils
+import numpy as np
 from . import common
 from . import compat
+from . import meshutil
+from . import weightutil
 
 
 # メニュー等に項目追加
@@ -16,6 +19,20 @@ def menu_func(self, context):
     column.operator('mesh.selected_mesh_vertex_group_calculation', text="選択部に四則演算", icon_value=icon_id)
 
 
+def selection_values(me, selection_kd, selection_blur_range, smooth_method):
+    """Blurred selection of every vertex, NaN for the vertices outside of it."""
+    dists = np.array([selection_kd.find(vert.co)[2] for vert in me.vertices])
+    values = np.full(len(me.vertices), np.nan)
+    is_selecteds = dists <= selection_blur_range + 0.00001
+    if 0 < selection_blur_range:
+        values[is_selecteds] = 1.0 - (dists[is_selecteds] / selection_blur_range)
+        if smooth_method == 'TRIGONOMETRIC':
+            values[is_selecteds] = meshutil.blend_curve(values[is_selecteds], smooth_method)
+    else:
+        values[is_selecteds] = 1.0
+    return values
+
+
 @compat.BlRegister()
 class CNV_OT_selected_mesh_vertex_group_blur(bpy.types.Operator):
     bl_idname = 'mesh.selected_mesh_vertex_group_blur'
@@ -47,6 +64,9 @@ class CNV_OT_selected_mesh_vertex_group_blur(bpy.types.Operator):
     blur_count = bpy.props.IntProperty(name="ウェイトをぼかす回数", default=1, min=1, max=100, soft_min=1, soft_max=100)
     is_vertex_group_limit_total = bpy.props.BoolProperty(name="ウェイト数を4つに制限", default=True)
 
+    # Largest (neighbor, group) product blurred at once
+    chunk_entries = 4 * 1024 * 1024
+
     @classmethod
     def poll(cls, context):
         ob = context.active_object
@@ -73,9 +93,6 @@ class CNV_OT_selected_mesh_vertex_group_blur(bpy.types.Operator):
         self.layout.prop(self, 'is_vertex_group_limit_total', icon='IMGDISPLAY')
 
     def execute(self, context):
-        class EmptyClass:
-            pass
-
         ob = context.active_object
         me = ob.data
 
@@ -140,18 +157,8 @@ class CNV_OT_selected_mesh_vertex_group_blur(bpy.types.Operator):
         average_edge_length = edge_lengths[edge_lengths_center_index]
         selection_blur_range = average_edge_length * self.selection_blur_range_multi
 
-        vert_selection_values = [None for v in me.vertices]
-        for vert in me.vertices:
-            co, index, dist = selection_kd.find(vert.co)
-            if dist <= selection_blur_range + 0.00001:
-                if 0 < selection_blur_range:
-                    if self.smooth_method == 'TRIGONOMETRIC':
-                        value = common.trigonometric_smooth(1.0 - (dist / selection_blur_range))
-                    else:
-                        value = 1.0 - (dist / selection_blur_range)
-                    vert_selection_values[vert.index] = value
-                else:
-                    vert_selection_values[vert.index] = 1.0
+        vert_selection_values = selection_values(
+            me, selection_kd, selection_blur_range, self.smooth_method)
 
         """
         # 頂点カラーで選択状態を確認
@@ -164,77 +171,61 @@ class CNV_OT_selected_mesh_vertex_group_blur(bpy.types.Operator):
                 preview_vertex_color.data[loop.index].color = (0, 0, 0)
         """
 
-        kd = mathutils.kdtree.KDTree(len(me.vertices))
-        # [kd.insert(v.co, v.index) for v in me.vertices]
-        for v in me.vertices:
-            kd.insert(v.co, v.index)
-        kd.balance()
+        selected_indices = np.flatnonzero(~np.isnan(vert_selection_values))
+        selected_values = vert_selection_values[selected_indices, None].astype(weightutil.WEIGHT_DTYPE)
 
         blur_range = average_edge_length * self.blur_range_multi
+        cos = meshutil.read_co(me.vertices)
+        indptr, indices, dists = meshutil.find_range_neighbors(
+            cos, blur_range, query_cos=cos[selected_indices])
+        if 0 < blur_range:
+            effects = meshutil.blend_curve(1.0 - (dists / blur_range), self.smooth_method)
+        else:
+            effects = np.ones(len(dists))
+        # Normalized effect of every neighbor, in rows of the selected vertices
+        row_counts = np.diff(indptr)
+        row_indices = np.repeat(np.arange(len(selected_indices)), row_counts)
+        totals = np.bincount(row_indices, weights=effects, minlength=len(selected_indices))
+        effects = (effects / totals[row_indices]).astype(weightutil.WEIGHT_DTYPE)
+
+        group_indices = [
+            vg.index for vg in ob.vertex_groups
+            if (self.target_vertex_group == 'ALL' or ob.vertex_groups.active.name == vg.name)
+            and not vg.lock_weight
+        ]
+        vertex_weights = weightutil.VertexWeights.from_object(ob)
+        weights = vertex_weights.dense(group_indices)
+        is_assigneds = vertex_weights.assigned(group_indices)
+
+        # Selected rows per chunk, to bound the (neighbors, groups) temporaries
+        average_fan_in = max(1, round(row_counts.mean())) if len(row_counts) else 1
+        chunk_size = max(1, self.chunk_entries // (average_fan_in * max(1, len(group_indices))))
 
         for i in range(self.blur_count):
-
-            pre_vert_weights = [[0.0 for vg in ob.vertex_groups] for v in me.vertices]
-            for vert in me.vertices:
-                for vge in vert.groups:
-                    pre_vert_weights[vert.index][vge.group] = vge.weight
-
-            for vert in me.vertices:
-                selection_value = vert_selection_values[vert.index]
-                if selection_value is None:
-                    continue
-
-                near_infos = []
-                total_effect = 0.0
-                for co, index, dist in kd.find_range(vert.co, blur_range):
-                    ec = EmptyClass()
-                    ec.index = index
-                    if 0 < blur_range:
-                        raw_effect = 1.0 - (dist / blur_range)
-                        if self.smooth_method == 'TRIGONOMETRIC':
-                            ec.effect = common.trigonometric_smooth(raw_effect)
-                        else:
-                            ec.effect = raw_effect
-                    else:
-                        ec.effect = 1.0
-                    total_effect += ec.effect
-                    near_infos.append(ec)
-
-                new_vert_weight = [0.0 for vg in ob.vertex_groups]
-                for ec in near_infos:
-                    pre_vert_weight = pre_vert_weights[ec.index]
-                    weight_multi = ec.effect / total_effect
-                    for vg_index, near_vert_pre_weight_value in enumerate(pre_vert_weight):
-                        current_vert_pre_weight_value = pre_vert_weights[vert.index][vg_index]
-
-                        if self.blur_mode == 'NORMAL':
-                            send_weight_value = near_vert_pre_weight_value
-                        elif self.blur_mode == 'ADD':
-                            if current_vert_pre_weight_value < near_vert_pre_weight_value:
-                                send_weight_value = near_vert_pre_weight_value
-                            else:
-                                send_weight_value = current_vert_pre_weight_value
-                        elif self.blur_mode == 'SUB':
-                            if near_vert_pre_weight_value < current_vert_pre_weight_value:
-                                send_weight_value = near_vert_pre_weight_value
-                            else:
-                                send_weight_value = current_vert_pre_weight_value
-
-                        new_vert_weight[vg_index] += send_weight_value * weight_multi
-
-                for vg in ob.vertex_groups:
-                    if self.target_vertex_group == 'ACTIVE' and ob.vertex_groups.active.name != vg.name: continue
-                    if vg.lock_weight:
-                        continue
-
-                    pre_weight = pre_vert_weights[vert.index][vg.index]
-                    new_weight = new_vert_weight[vg.index]
-                    result_weight = (pre_weight * (1.0 - selection_value)) + (new_weight * selection_value)
-
-                    if 0.0 < result_weight:
-                        vg.add([vert.index], result_weight, 'REPLACE')
-                    else:
-                        vg.remove([vert.index])
+            result_weights = np.empty((len(selected_indices), len(group_indices)), dtype=weights.dtype)
+            for start in range(0, len(selected_indices), chunk_size):
+                stop = min(start + chunk_size, len(selected_indices))
+                begin, end = indptr[start], indptr[stop]
+                chunk_row_counts = row_counts[start:stop]
+                pre_weights = weights[selected_indices[start:stop]]
+                near_weights = weights[indices[begin:end]]
+                if self.blur_mode == 'ADD':
+                    near_weights = np.maximum(near_weights, np.repeat(pre_weights, chunk_row_counts, axis=0))
+                elif self.blur_mode == 'SUB':
+                    near_weights = np.minimum(near_weights, np.repeat(pre_weights, chunk_row_counts, axis=0))
+                new_weights = np.zeros_like(pre_weights)
+                if len(near_weights):
+                    is_rows = 0 < chunk_row_counts
+                    new_weights[is_rows] = np.add.reduceat(
+                        near_weights * effects[begin:end, None], indptr[start:stop][is_rows] - begin, axis=0)
+
+                values = selected_values[start:stop]
+                result_weights[start:stop] = (pre_weights * (1.0 - values)) + (new_weights * values)
+            is_weighteds = 0.0 < result_weights
+            weights[selected_indices] = np.where(is_weighteds, result_weights, 0.0)
+            is_assigneds[selected_indices] = is_weighteds
+
+        vertex_weights.write_changes(ob.vertex_groups, group_indices, weights, is_assigneds)
 
         if self.is_vertex_group_limit_total:
             bpy.ops.object.vertex_group_limit_total(group_select_mode='ALL', limit=4)
@@ -305,9 +296,6 @@ class CNV_OT_selected_mesh_vertex_group_calculation(bpy.types.Operator):
         self.layout.label(text=calculation_text)
 
     def execute(self, context):
-        class EmptyClass:
-            pass
-
         if self.calculation_mode == 'DIV' and self.calculation_value == 0.0:
             self.report(type={'ERROR'}, message="0で除算することはできません、中止します")
             return {'CANCELLED'}
@@ -371,18 +359,8 @@ class CNV_OT_selected_mesh_vertex_group_calculation(bpy.types.Operator):
         average_edge_length = edge_lengths[edge_lengths_center_index]
         selection_blur_range = average_edge_length * self.selection_blur_range_multi
 
-        vert_selection_values = [None for v in me.vertices]
-        for vert in me.vertices:
-            co, index, dist = selection_kd.find(vert.co)
-            if dist <= selection_blur_range + 0.00001:
-                if 0 < selection_blur_range:
-                    if self.smooth_method == 'TRIGONOMETRIC':
-                        value = common.trigonometric_smooth(1.0 - (dist / selection_blur_range))
-                    else:
-                        value = 1.0 - (dist / selection_blur_range)
-                    vert_selection_values[vert.index] = value
-                else:
-                    vert_selection_values[vert.index] = 1.0
+        vert_selection_values = selection_values(
+            me, selection_kd, selection_blur_range, self.smooth_method)
 
         """
         # 頂点カラーで選択状態を確認
@@ -395,36 +373,31 @@ class CNV_OT_selected_mesh_vertex_group_calculation(bpy.types.Operator):
                 preview_vertex_color.data[loop.index].color = (0, 0, 0)
         """
 
-        for vert in me.vertices:
-            effect = vert_selection_values[vert.index]
-            if effect is None:
-                continue
-
-            pre_vert_weight = 0.0
-            for vge in vert.groups:
-                if ob.vertex_groups.active.index == vge.group:
-                    pre_vert_weight = vge.weight
-
-            if self.calculation_mode == 'ADD':
-                new_vert_weight = pre_vert_weight + self.calculation_value
-            elif self.calculation_mode == 'SUB':
-                new_vert_weight = pre_vert_weight - self.calculation_value
-            elif self.calculation_mode == 'MULTI':
-                new_vert_weight = pre_vert_weight * self.calculation_value
-            elif self.calculation_mode == 'DIV':
-                new_vert_weight = pre_vert_weight / self.calculation_value
-
-            if new_vert_weight < 0.0:
-                new_vert_weight = 0.0
-            elif 1.0 < new_vert_weight:
-                new_vert_weight = 1.0
-
-            new_vert_weight = (pre_vert_weight * (1.0 - effect)) + (new_vert_weight * effect)
-
-            if 0.0 < new_vert_weight:
-                ob.vertex_groups.active.add([vert.index], new_vert_weight, 'REPLACE')
-            else:
-                ob.vertex_groups.active.remove([vert.index])
+        selected_indices = np.flatnonzero(~np.isnan(vert_selection_values))
+        effects = vert_selection_values[selected_indices]
+
+        group_index = ob.vertex_groups.active.index
+        vertex_weights = weightutil.VertexWeights.from_object(ob)
+        weights = vertex_weights.dense([group_index])
+        is_assigneds = vertex_weights.assigned([group_index])
+
+        pre_vert_weights = weights[selected_indices, 0]
+        if self.calculation_mode == 'ADD':
+            new_vert_weights = pre_vert_weights + self.calculation_value
+        elif self.calculation_mode == 'SUB':
+            new_vert_weights = pre_vert_weights - self.calculation_value
+        elif self.calculation_mode == 'MULTI':
+            new_vert_weights = pre_vert_weights * self.calculation_value
+        elif self.calculation_mode == 'DIV':
+            new_vert_weights = pre_vert_weights / self.calculation_value
+        new_vert_weights = np.clip(new_vert_weights, 0.0, 1.0)
+
+        new_vert_weights = (pre_vert_weights * (1.0 - effects)) + (new_vert_weights * effects)
+
+        is_weighteds = 0.0 < new_vert_weights
+        weights[selected_indices, 0] = np.where(is_weighteds, new_vert_weights, 0.0)
+        is_assigneds[selected_indices, 0] = is_weighteds
+        vertex_weights.write_changes(ob.vertex_groups, [group_index], weights, is_assigneds)
 
         bpy.ops.object.mode_set(mode=pre_mode)
         for selected_object in pre_selected_objects:
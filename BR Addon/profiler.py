@@ -0,0 +1,122 @@
+"""Named-phase timing for long running operators.
+
+A Profiler collects one record per phase name (wall time, call count, vertex
+and key counts, and peak traced memory when enabled) and can write them as a
+JSON line to a rotating log.
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import logging.handlers
+import os
+import time
+import tracemalloc
+
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+_loggers = {}
+
+
+class PhaseRecord:
+    __slots__ = ("name", "seconds", "calls", "verts", "keys", "peak_bytes")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.verts = 0
+        self.keys = 0
+        self.peak_bytes = None
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Profiler:
+    """Accumulates the phases of one operator run.
+
+    Phases with the same name add up, so a phase run once per loop() call
+    ends up as a single record. Memory is traced with tracemalloc only when
+    `trace_memory` is set, since tracing slows down every allocation.
+    """
+
+    def __init__(self, name: str, trace_memory: bool = False):
+        self.name = name
+        self.info = {}
+        self.records = {}
+        self.start_time = time.perf_counter()
+        self.trace_memory = trace_memory
+        self._is_own_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._is_own_tracing = True
+
+    @contextlib.contextmanager
+    def phase(self, name: str, verts: int = 0, keys: int = 0):
+        """Time the body of a with statement, yields the phase's record."""
+        record = self.count(name, verts, keys)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds += time.perf_counter() - start
+            record.calls += 1
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                record.peak_bytes = max(record.peak_bytes or 0, peak)
+
+    def count(self, name: str, verts: int = 0, keys: int = 0) -> PhaseRecord:
+        """Add vertex and key counts to a phase, e.g. once they are known."""
+        record = self.records.get(name)
+        if record is None:
+            record = self.records[name] = PhaseRecord(name)
+        record.verts += verts
+        record.keys += keys
+        return record
+
+    def stop(self):
+        if self._is_own_tracing:
+            tracemalloc.stop()
+            self._is_own_tracing = False
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def as_dict(self) -> dict:
+        return {
+            "operator": self.name,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "total_seconds": self.total_seconds,
+            **self.info,
+            "phases": [record.as_dict() for record in self.records.values()],
+        }
+
+    def summary(self, limit: int = 3) -> str:
+        """The slowest phases, e.g. "neighbor_search 1.20s, apply 0.40s"."""
+        records = sorted(self.records.values(), key=lambda r: r.seconds, reverse=True)
+        return ", ".join(f"{r.name} {r.seconds:.2f}s" for r in records[:limit])
+
+    def write_log(self, path: str):
+        """Append this run as one JSON line to a rotating log at `path`."""
+        logger = _loggers.get(path)
+        if logger is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                path,
+                maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger(f"{__name__}.{len(_loggers)}")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            _loggers[path] = logger
+        logger.info(json.dumps(self.as_dict()))
@@ -0,0 +1,163 @@
+"""Vertex group weights as NumPy arrays.
+
+VertexWeights reads the deform weights of every vertex group in one pass
+over the vertices into a sparse CSR matrix, and hands out dense per-group
+columns on demand. write_group() writes weights back with one
+`VertexGroup.add` call per distinct weight instead of one per vertex.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+WEIGHT_DTYPE = np.float32
+
+
+class VertexWeights:
+    """Sparse (vertex -> group, weight) matrix of a mesh's deform weights.
+
+    Row `i` lists the groups `groups[indptr[i]:indptr[i+1]]` vertex `i` is
+    assigned to and their `weights`, in the order of `vert.groups`.
+    """
+
+    def __init__(self, indptr, groups, weights, group_count: int):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.groups = np.asarray(groups, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=WEIGHT_DTYPE)
+        self.group_count = group_count
+        self.rows = np.repeat(
+            np.arange(self.vert_count, dtype=np.int32), np.diff(self.indptr)
+        )
+
+    @classmethod
+    def from_object(cls, ob) -> VertexWeights:
+        return cls.from_vertices(ob.data.vertices, len(ob.vertex_groups))
+
+    @classmethod
+    def from_vertices(cls, vertices, group_count: int = None) -> VertexWeights:
+        """Read every `vert.groups` element, in a single pass over `vertices`."""
+        row_counts = []
+        groups = []
+        weights = []
+        for vert in vertices:
+            elems = vert.groups
+            row_counts.append(len(elems))
+            for elem in elems:
+                groups.append(elem.group)
+                weights.append(elem.weight)
+        if group_count is None:
+            group_count = max(groups) + 1 if groups else 0
+        indptr = np.concatenate(([0], np.cumsum(row_counts, dtype=np.int64)))
+        return cls(indptr, groups, weights, group_count)
+
+    @property
+    def vert_count(self) -> int:
+        return len(self.indptr) - 1
+
+    def _entry_columns(self, group_indices) -> np.ndarray:
+        """Column of every entry among `group_indices`, -1 for other groups."""
+        columns = np.full(max(self.group_count, 1), -1, dtype=np.int64)
+        for column, group_index in enumerate(group_indices):
+            if 0 <= group_index < self.group_count:
+                columns[group_index] = column
+        return columns[self.groups]
+
+    def dense(self, group_indices) -> np.ndarray:
+        """(N, G) weights of the given groups, 0 where a vertex isn't assigned
+        and for a group index of -1.
+        """
+        group_indices = list(group_indices)
+        entry_columns = self._entry_columns(group_indices)
+        is_used = 0 <= entry_columns
+        result = np.zeros((self.vert_count, len(group_indices)), dtype=WEIGHT_DTYPE)
+        result[self.rows[is_used], entry_columns[is_used]] = self.weights[is_used]
+        return result
+
+    def column(self, group_index: int) -> np.ndarray:
+        """(N,) weights of one group."""
+        return self.dense([group_index])[:, 0]
+
+    def assigned(self, group_indices) -> np.ndarray:
+        """(N, G) mask of the vertices assigned to the given groups, even with a weight of 0."""
+        group_indices = list(group_indices)
+        entry_columns = self._entry_columns(group_indices)
+        is_used = 0 <= entry_columns
+        result = np.zeros((self.vert_count, len(group_indices)), dtype=bool)
+        result[self.rows[is_used], entry_columns[is_used]] = True
+        return result
+
+    def write_changes(self, vertex_groups, group_indices, weights, is_assigneds):
+        """Write the (N, G) `weights` and assignments of the given groups back,
+        touching only the vertices that differ from this matrix.
+        """
+        group_indices = list(group_indices)
+        old_weights = self.dense(group_indices)
+        old_is_assigneds = self.assigned(group_indices)
+        for column, group_index in enumerate(group_indices):
+            is_changeds = (weights[:, column] != old_weights[:, column]) | (
+                is_assigneds[:, column] != old_is_assigneds[:, column]
+            )
+            add_indices = np.flatnonzero(is_changeds & is_assigneds[:, column])
+            remove_indices = np.flatnonzero(
+                is_changeds & old_is_assigneds[:, column] & ~is_assigneds[:, column]
+            )
+            write_group(
+                vertex_groups[group_index],
+                weights[add_indices, column],
+                add_indices,
+                remove_indices,
+            )
+
+    def group_max(self) -> np.ndarray:
+        """Largest weight of every group, 0 for groups without vertices."""
+        result = np.zeros(self.group_count, dtype=WEIGHT_DTYPE)
+        np.maximum.at(result, self.groups, self.weights)
+        return result
+
+
+def write_group(vertex_group, weights, indices=None, remove_indices=None):
+    """Replace the weights of `indices` (all vertices when None) in a vertex group.
+
+    Vertices with identical weights share one `add` call, and
+    `remove_indices` are unassigned with one `remove` call. Weights are
+    clamped to [0, 1] like `add` does.
+    """
+    weights = np.clip(np.asarray(weights, dtype=WEIGHT_DTYPE), 0.0, 1.0)
+    if indices is None:
+        indices = np.arange(len(weights))
+    indices = np.asarray(indices)
+
+    if remove_indices is not None and len(remove_indices):
+        vertex_group.remove(np.asarray(remove_indices).tolist())
+    if not len(indices):
+        return
+
+    order = np.argsort(weights, kind="stable")
+    sorted_weights = weights[order]
+    bounds = np.concatenate(
+        ([0], np.flatnonzero(np.diff(sorted_weights)) + 1, [len(order)])
+    )
+    for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        vertex_group.add(
+            indices[order[start:stop]].tolist(), float(sorted_weights[start]), "REPLACE"
+        )
+
+
+def rescale_others(weights: np.ndarray, column: int, diffs: np.ndarray, rows=None):
+    """Keep the weight total of each vertex by scaling its other groups, after
+    the weights of `column` in the (N, G) `weights` changed by `diffs`.
+
+    Only `rows` (a mask or indices, all vertices when None) are rescaled.
+    Vertices without other weights are left as they are.
+    """
+    if rows is None:
+        rows = slice(None)
+    others = weights[rows]
+    other_totals = others.sum(axis=1) - others[:, column]
+    multis = np.zeros(len(others), dtype=weights.dtype)
+    is_weighteds = 0.0 < other_totals
+    multis[is_weighteds] = (
+        other_totals[is_weighteds] - diffs[rows][is_weighteds]
+    ) / other_totals[is_weighteds]
+    rescaled = np.clip(others * multis[:, None], 0.0, 1.0)
+    rescaled[:, column] = others[:, column]
+    weights[rows] = rescaled
@@ -0,0 +1,244 @@
+"""Shape Key Transfer Benchmark
+
+Times the quick, precision and weighted shape key transfer operators on
+synthetic body/garment meshes, with Blender-as-a-Module (`bpy==3.4`, see
+requirements.txt). `prepare`, `loop` and `finish` are timed separately and
+the results are written as JSON, to compare throughput across versions.
+
+Usage:
+    python benchmarks/shape_key_transfer.py --sizes 5000 50000 --output bench.json
+or inside Blender:
+    blender -b --python benchmarks/shape_key_transfer.py -- --sizes 5000
+"""
+
+import argparse
+import importlib.util
+import json
+import math
+import platform
+import sys
+import time
+from pathlib import Path
+
+import bpy
+import bmesh
+import mathutils
+import numpy as np
+
+ADDON_DIR = Path(__file__).resolve().parent.parent / "BR Addon"
+ADDON_PACKAGE = "braddon"
+
+OPERATORS = {
+    "quick": "quick_shape_key_transfer",
+    "precision": "precision_shape_key_transfer",
+    "weighted": "weighted_shape_key_transfer",
+}
+PHASES = ("prepare", "loop", "finish")
+
+
+def load_addon():
+    """Import the addon folder as a package and register it."""
+    if ADDON_PACKAGE in sys.modules:
+        return sys.modules[ADDON_PACKAGE]
+    spec = importlib.util.spec_from_file_location(
+        ADDON_PACKAGE,
+        ADDON_DIR / "__init__.py",
+        submodule_search_locations=[str(ADDON_DIR)],
+    )
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[ADDON_PACKAGE] = addon
+    spec.loader.exec_module(addon)
+    addon.register()
+    return addon
+
+
+class PhaseTimer:
+    """Wraps the phases of shape_key_transfer_op to accumulate their time."""
+
+    def __init__(self, op_class):
+        self.op_class = op_class
+        self.originals = {}
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+
+    def __enter__(self):
+        for phase in PHASES:
+            original = getattr(self.op_class, phase)
+            self.originals[phase] = original
+            setattr(self.op_class, phase, self.wrap(phase, original))
+        return self
+
+    def __exit__(self, *exc_info):
+        for phase, original in self.originals.items():
+            setattr(self.op_class, phase, original)
+
+    def wrap(self, phase, original):
+        def timed(op, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(op, *args, **kwargs)
+            finally:
+                self.times[phase] += time.perf_counter() - start
+                self.calls[phase] += 1
+
+        return timed
+
+
+def uv_sphere(name, vertex_count, radius, rotation=0.0):
+    """A UV sphere object with about `vertex_count` vertices."""
+    rings = max(3, round(math.sqrt(vertex_count / 2)))
+    me = bpy.data.meshes.new(name)
+    bm = bmesh.new()
+    bmesh.ops.create_uvsphere(
+        bm, u_segments=rings * 2, v_segments=rings + 1, radius=radius
+    )
+    bmesh.ops.rotate(
+        bm,
+        verts=bm.verts,
+        cent=(0, 0, 0),
+        matrix=mathutils.Matrix.Rotation(rotation, 3, "Z"),
+    )
+    bm.to_mesh(me)
+    bm.free()
+    ob = bpy.data.objects.new(name, me)
+    bpy.context.scene.collection.objects.link(ob)
+    return ob
+
+
+def add_shape_keys(ob, key_count, empty_ratio, rng):
+    """Add smooth random bumps as shape keys, some of them left empty."""
+    me = ob.data
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", co)
+    co = co.reshape(-1, 3)
+    normals = co / np.linalg.norm(co, axis=1, keepdims=True)
+
+    ob.shape_key_add(name="Basis", from_mix=False)
+    for index in range(key_count):
+        key = ob.shape_key_add(name=f"Key{index:03d}", from_mix=False)
+        if rng.random() < empty_ratio:
+            continue
+        center = rng.normal(size=3)
+        center /= np.linalg.norm(center)
+        falloff = np.exp(-np.sum((normals - center) ** 2, axis=1) / 0.1)
+        key.data.foreach_set(
+            "co", (co + normals * (0.1 * falloff)[:, None]).astype(np.float32).ravel()
+        )
+
+
+def add_vertex_group(ob, name):
+    """Weight every vertex by its height, for the weighted transfer."""
+    vg = ob.vertex_groups.new(name=name)
+    for vert in ob.data.vertices:
+        vg.add([vert.index], min(1.0, max(0.0, vert.co.z * 0.5 + 0.5)), "REPLACE")
+
+
+def make_scene(vertex_count, key_count, empty_ratio, seed):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    rng = np.random.default_rng(seed)
+    body = uv_sphere("Body", vertex_count, 1.0)
+    garment = uv_sphere("Garment", vertex_count, 1.05, rotation=0.1)
+    add_shape_keys(body, key_count, empty_ratio, rng)
+    add_vertex_group(body, "Group")
+    add_vertex_group(garment, "Group")
+    return body, garment
+
+
+def run_transfer(addon, method, body, garment, options):
+    specials = addon.misc_MESH_MT_shape_key_specials
+    addon.meshutil.binding_cache.clear()
+    garment.shape_key_clear()
+
+    bpy.ops.object.select_all(action="DESELECT")
+    body.select_set(True)
+    garment.select_set(True)
+    bpy.context.view_layer.objects.active = garment
+
+    kwargs = dict(options)
+    if method == "weighted":
+        kwargs["using_vgroups"] = [{"name": "Group", "index": 0, "value": True}]
+
+    operator = getattr(bpy.ops.object, OPERATORS[method])
+    with PhaseTimer(specials.shape_key_transfer_op) as timer:
+        start = time.perf_counter()
+        operator(**kwargs)
+        total = time.perf_counter() - start
+
+    key_count = (
+        len(garment.data.shape_keys.key_blocks) if garment.data.shape_keys else 0
+    )
+    target_verts = len(garment.data.vertices)
+    return {
+        "method": method,
+        "total": total,
+        "times": timer.times,
+        "calls": timer.calls,
+        "target_keys": key_count,
+        "verts_per_sec": (
+            target_verts * key_count / timer.times["loop"]
+            if timer.times["loop"]
+            else None
+        ),
+    }
+
+
+def parse_args(argv):
+    # Arguments after "--" when run by the blender executable
+    if "--" in argv:
+        argv = argv[argv.index("--") + 1 :]
+    else:
+        argv = argv[1:]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000, 200000])
+    parser.add_argument("--keys", type=int, default=20)
+    parser.add_argument("--empty-ratio", type=float, default=0.2)
+    parser.add_argument(
+        "--methods", nargs="+", choices=list(OPERATORS), default=list(OPERATORS)
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--subdivide", type=int, default=1)
+    parser.add_argument(
+        "--batch", action="store_true", help="Enable batched shape keys"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    addon = load_addon()
+
+    options = {"subdivide_number": args.subdivide, "is_batch": args.batch}
+    results = []
+    for size in args.sizes:
+        body, garment = make_scene(size, args.keys, args.empty_ratio, args.seed)
+        for method in args.methods:
+            for run in range(args.repeat):
+                result = run_transfer(addon, method, body, garment, options)
+                result.update(size=size, source_verts=len(body.data.vertices), run=run)
+                results.append(result)
+                print(
+                    f"{method:>9} {size:>7} verts: {result['total']:.2f}s "
+                    + " ".join(f"{p}={result['times'][p]:.3f}s" for p in PHASES),
+                    file=sys.stderr,
+                )
+
+    report = {
+        "addon_version": ".".join(str(i) for i in addon.bl_info["version"]),
+        "blender_version": bpy.app.version_string,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "options": dict(vars(args), output=str(args.output) if args.output else None),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,84 @@
+"""Binding cache keys of the shape key transfers, with Blender-as-a-Module
+(`bpy`, see requirements.txt).
+
+    python -m pytest tests
+"""
+
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+ADDON_DIR = Path(__file__).resolve().parent.parent / "BR Addon"
+ADDON_PACKAGE = "braddon"
+
+
+@pytest.fixture(scope="module")
+def meshutil():
+    """Import the addon folder as a package, without registering it."""
+    addon = sys.modules.get(ADDON_PACKAGE)
+    if addon is None:
+        spec = importlib.util.spec_from_file_location(
+            ADDON_PACKAGE,
+            ADDON_DIR / "__init__.py",
+            submodule_search_locations=[str(ADDON_DIR)],
+        )
+        addon = importlib.util.module_from_spec(spec)
+        sys.modules[ADDON_PACKAGE] = addon
+        spec.loader.exec_module(addon)
+    return addon.meshutil
+
+
+@pytest.fixture
+def source_ob():
+    """A triangle with a basis and one active shape key."""
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    me = bpy.data.meshes.new("Source")
+    me.from_pydata([(0, 0, 0), (1, 0, 0), (0, 1, 0)], [], [(0, 1, 2)])
+    ob = bpy.data.objects.new("Source", me)
+    bpy.context.scene.collection.objects.link(ob)
+    ob.shape_key_add(name="Basis", from_mix=False)
+    key = ob.shape_key_add(name="Key", from_mix=False)
+    key.data[0].co = (0, 0, 1)
+    key.value = 1.0
+    return ob
+
+
+def mix_fingerprint(meshutil, ob):
+    return meshutil.object_fingerprint(ob, use_key_values=True)
+
+
+def assert_cache_misses(meshutil, before, after):
+    """A binding cached under `before` isn't returned for `after`."""
+    cache = meshutil.BindingCache()
+    cache.put(before, types.SimpleNamespace(nbytes=1), 1024)
+    assert cache.get(before) is not None
+    assert cache.get(after) is None
+
+
+def test_muting_a_key_invalidates_the_binding(meshutil, source_ob):
+    before = mix_fingerprint(meshutil, source_ob)
+    source_ob.data.shape_keys.key_blocks["Key"].mute = True
+    assert_cache_misses(meshutil, before, mix_fingerprint(meshutil, source_ob))
+
+
+def test_masking_a_key_invalidates_the_binding(meshutil, source_ob):
+    vertex_group = source_ob.vertex_groups.new(name="Mask")
+    vertex_group.add([0], 1.0, "REPLACE")
+    key = source_ob.data.shape_keys.key_blocks["Key"]
+
+    before = mix_fingerprint(meshutil, source_ob)
+    key.vertex_group = vertex_group.name
+    masked = mix_fingerprint(meshutil, source_ob)
+    assert_cache_misses(meshutil, before, masked)
+
+    vertex_group.add([0], 0.5, "REPLACE")
+    assert_cache_misses(meshutil, masked, mix_fingerprint(meshutil, source_ob))
+
+
+def test_unchanged_mix_reuses_the_binding(meshutil, source_ob):
+    assert mix_fingerprint(meshutil, source_ob) == mix_fingerprint(meshutil, source_ob)